@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,9 +9,18 @@ from app.routes.estimate import router as estimate_router
 from app.routes.UI.ui import router as ui_router
 from app.routes.UI.ui_with_processing import router as processing_router
 from app.routes.UI.upload_ui.routes import router as ui_routes_router
+from app.services.parse_pool import start_parse_pool, shutdown_parse_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the PDF parse workers before the first upload arrives
+    start_parse_pool()
+    yield
+    shutdown_parse_pool()
 
 
-app = FastAPI(title="FlagTech Estimate Parser")
+app = FastAPI(title="FlagTech Estimate Parser", lifespan=lifespan)
 
 # ---------------------------------------------------------
 # CORS CONFIGURATION
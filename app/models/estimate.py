@@ -10,4 +10,8 @@ class LineItem(BaseModel):
     
 
 class EstimateResponse(BaseModel):
-    line_items: List[LineItem]
\ No newline at end of file
+    line_items: List[LineItem]
+    total_labor: Optional[float] = None
+    total_paint: Optional[float] = None
+    second_ro_line: Optional[str] = None
+    vehicle_info_line: Optional[str] = None
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, UploadFile, File
-from fastapi.responses import HTMLResponse
-from app.services.extractor import extract_text_from_pdf, extract_words_from_pdf
-from app.services.parser import parse_estimate_text
-from app.services.grid_processor import process_pdf_grid, generate_pages_html
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from app.services.jobs import get_job
+from app.services.parse_cache import grid_cache
+from app.services.tiles import TILE_KEY_PATTERN, media_type
+from app.services.aligned_export import EXPORT_FORMATS, export_error, export_head, export_rows, export_tail
+from app.services.grid_processor import page_frame
+from app.services.parse_pool import page_fragment, page_tile, parse_grid, parse_text_items, start_grid_job, stream_aligned
+from app.services.uploads import spool_upload
 from .flagout import get_flagtech_screen_html
 from .ros import get_ros_screen_html
 from .techs import get_techs_screen_html
@@ -19,9 +23,12 @@ except ImportError:
     from upload import get_upload_screen_html, get_upload_script
     from labor import get_labor_modal_html, get_labor_modal_styles, get_labor_modal_script
     from paint import get_refinish_modal_html, get_refinish_modal_styles, get_refinish_modal_script, get_modal_close_handler
+import asyncio
+from contextlib import AsyncExitStack, aclosing
 import math
 import re
 import json
+import time
 
 router = APIRouter()
 
@@ -149,7 +156,8 @@ async def upload_form():
 
 @router.post("/parse", response_class=HTMLResponse)
 async def parse_ui(file: UploadFile = File(...)):
-    text = extract_text_from_pdf(file)
+    parsed = await parse_text_items(file)
+    text = parsed["text"]
     # Debug logging: show a truncated preview of extracted text
     try:
         print("===EXTRACTED TEXT PREVIEW (truncated)===")
@@ -158,7 +166,7 @@ async def parse_ui(file: UploadFile = File(...)):
     except Exception:
         print("[extractor] could not print text preview")
 
-    items = parse_estimate_text(text)
+    items = parsed["items"]
     print(f"[parser] parsed {len(items)} items")
 
     rows = ""
@@ -198,49 +206,76 @@ async def parse_ui(file: UploadFile = File(...)):
 
 
 
-@router.post("/grid", response_class=HTMLResponse)
-async def grid_ui(file: UploadFile = File(...), ajax: str = None):
-    pages = extract_words_from_pdf(file)
-    if not pages:
-        return "<html><body><p>No words found in PDF.</p><a href='/ui'>Back</a></body></html>"
+# Page boxes are sized up front and filled from /ui/grid/{key}/pages/{page}
+# as they come within a screen or so of the viewport
+GRID_PAGE_LOADER = """
+(function() {
+  function loadPage(el) {
+    if (el.dataset.loaded) return;
+    el.dataset.loaded = '1';
+    fetch(el.dataset.pageSrc)
+      .then(r => r.ok ? r.text() : Promise.reject(r.status))
+      .then(html => { el.innerHTML = html; })
+      .catch(err => {
+        el.dataset.loaded = '';
+        console.error('Page load error:', err);
+      });
+  }
+  const pages = document.querySelectorAll('.grid-page[data-page-src]');
+  if (!('IntersectionObserver' in window)) {
+    pages.forEach(loadPage);
+    return;
+  }
+  const observer = new IntersectionObserver(entries => {
+    entries.forEach(entry => {
+      if (entry.isIntersecting) {
+        observer.unobserve(entry.target);
+        loadPage(entry.target);
+      }
+    });
+  }, { rootMargin: '1000px 0px' });
+  pages.forEach(el => observer.observe(el));
+})();
+"""
 
-    # Process PDF using service layer
-    result = process_pdf_grid(pages)
-    
-    # Extract results from service
+
+def _grid_page_shell(parsed) -> str:
+    """Empty, correctly sized page boxes; each page's words load lazily (see GRID_PAGE_LOADER)."""
+    key = parsed["key"]
+    return "".join(
+        page_frame(fragment, attrs=f" class='grid-page' data-page-src='/ui/grid/{key}/pages/{fragment['page']}'")
+        for fragment in parsed["pages"]
+    )
+
+
+def _grid_content(parsed) -> str:
+    """Grid page body (visualization plus labor/refinish modals) injected by the upload screen."""
+    result = parsed["result"]
     labor_items = result["labor_items"]
     paint_items = result["paint_items"]
     total_labor = result["total_labor"]
     total_paint = result["total_paint"]
     second_ro_line = result["second_ro_line"]
     vehicle_info_line = result["vehicle_info_line"]
-    anchor_page = result["anchor_page"]
-    anchor_ymid = result["anchor_ymid"]
-    subtotals_page = result["subtotals_page"]
-    subtotals_ymid = result["subtotals_ymid"]
-    
-    # Generate pages HTML visualization
-    pages_html = generate_pages_html(pages, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
-    
+    pages_html = _grid_page_shell(parsed)
+
     labor_items_json = json.dumps(labor_items)
     paint_items_json = json.dumps(paint_items)
 
-    # If AJAX request, return just the content without HTML wrapper
-    if ajax:
-        # Generate modal HTML using imported functions
-        labor_modal = get_labor_modal_html(second_ro_line, vehicle_info_line, total_labor)
-        refinish_modal = get_refinish_modal_html(second_ro_line, vehicle_info_line, total_paint)
-        
-        # Generate modal styles
-        labor_styles = get_labor_modal_styles()
-        refinish_styles = get_refinish_modal_styles()
-        
-        # Generate modal scripts
-        labor_script = get_labor_modal_script(labor_items_json, total_labor, second_ro_line, vehicle_info_line)
-        refinish_script = get_refinish_modal_script(paint_items_json, total_paint, second_ro_line, vehicle_info_line)
-        close_handler = get_modal_close_handler()
-        
-        content = f"""
+    # Generate modal HTML using imported functions
+    labor_modal = get_labor_modal_html(second_ro_line, vehicle_info_line, total_labor)
+    refinish_modal = get_refinish_modal_html(second_ro_line, vehicle_info_line, total_paint)
+    
+    # Generate modal styles
+    labor_styles = get_labor_modal_styles()
+    refinish_styles = get_refinish_modal_styles()
+    
+    # Generate modal scripts
+    labor_script = get_labor_modal_script(labor_items_json, total_labor, second_ro_line, vehicle_info_line)
+    refinish_script = get_refinish_modal_script(paint_items_json, total_paint, second_ro_line, vehicle_info_line)
+    close_handler = get_modal_close_handler()
+    
+    content = f"""
 <h2>Document Visual Grid</h2>
 <button onclick="openLaborModal()" style='padding:10px 20px; font-size:14px; cursor:pointer; background-color:#505050; color:white; border:none; border-radius:3px; margin-right:10px;'>Assign Labor</button>
 <button onclick="openRefinishModal()" style='padding:10px 20px; font-size:14px; cursor:pointer; background-color:#505050; color:white; border:none; border-radius:3px;'>Assign Refinish</button>
@@ -291,142 +326,180 @@ async def grid_ui(file: UploadFile = File(...), ajax: str = None):
 {labor_script}
 {refinish_script}
 {close_handler}
+{GRID_PAGE_LOADER}
 </script>
         """
-        return content
+    return content
 
 
-@router.post("/aligned", response_class=HTMLResponse)
-async def aligned_ui(file: UploadFile = File(...)):
-    from app.services.grid_processor import kmeans_1d, group_rows
-    
-    pages = extract_words_from_pdf(file)
-    if not pages:
-        return "<html><body><p>No words found in PDF.</p><a href='/ui'>Back</a></body></html>"
+# Grid cache keys: sha256 of the PDF plus the parser version
+GRID_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}-v[0-9A-Za-z.]+$")
+
+
+@router.get("/grid/{key}/pages/{page}", response_class=HTMLResponse)
+async def grid_page(key: str, page: int):
+    """One page's word boxes for the grid view, from the cached parse of that document."""
+    if not GRID_KEY_PATTERN.match(key):
+        raise HTTPException(status_code=404, detail="Unknown document")
+    fragment = await page_fragment(key, page)
+    if fragment is None:
+        raise HTTPException(status_code=404, detail="Page not cached; upload again")
+    # Keys are content hashes plus parser version, so a fragment never changes
+    return HTMLResponse(fragment["html"], headers={"Cache-Control": "private, max-age=86400, immutable"})
+
 
-    # compute xmid/ymid and page index for all words across all pages
-    all_words = []
-    for pi, page in enumerate(pages, start=1):
-        for wdict in page.get("words", []):
-            wdict["page_index"] = pi
-            wdict["xmid"] = (wdict["x0"] + wdict["x1"]) / 2.0
-            wdict["ymid"] = (wdict["y0"] + wdict["y1"]) / 2.0
-            all_words.append(wdict)
+@router.get("/tiles/{key}")
+async def grid_tile(key: str, doc: str = "", page: int = 0):
+    """
+    A rendered page image, rendered on first request from the document (grid
+    cache key) and page it is shown on. Keys are page content hashes plus DPI
+    and format, so tiles never change.
+    """
+    if not TILE_KEY_PATTERN.match(key) or not GRID_KEY_PATTERN.match(doc):
+        raise HTTPException(status_code=404, detail="Unknown tile")
+    image = await page_tile(key, doc, page)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Tile not cached; upload again")
+    return Response(image, media_type=media_type(key), headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
-    if not all_words:
+
+@router.post("/grid", response_class=HTMLResponse)
+async def grid_ui(file: UploadFile = File(...), ajax: str = None):
+    # Extraction, grid processing and page rendering all run on the parse pool
+    parsed = await parse_grid(file)
+    if parsed["result"] is None:
         return "<html><body><p>No words found in PDF.</p><a href='/ui'>Back</a></body></html>"
 
-    # determine anchor (second RO row) and end marker (ESTIMATE TOTALS row)
-    anchor_page = None
-    anchor_ymid = None
-    subtotals_page = None
-    subtotals_ymid = None
-    ro_count = 0
-    
-    for pi, page in enumerate(pages, start=1):
-        rows = group_rows(page.get("words", []), y_thresh=6.0)
-        for r in rows:
-            row_text = " ".join(w.get("text", "") for w in r["words"]).strip()
-            
-            # Look for RO and use the second occurrence as anchor
-            if re.search(r"\bRO\b", row_text):
-                ro_count += 1
-                if ro_count == 2 and not anchor_page:
-                    anchor_page = pi
-                    anchor_ymid = r["ymid"]
-            
-            # Look for ESTIMATE TOTALS as end marker
-            if not subtotals_page and re.search(r"\bESTIMATE\s+TOTALS\b", row_text):
-                subtotals_page = pi
-                subtotals_ymid = r["ymid"]
-            
-            if anchor_page and subtotals_page:
-                break
-        
-        if anchor_page and subtotals_page:
-            break
-
-    # collect all xmid values to cluster into 5 columns (global across pages)
-    # if anchor found, only use words at/after anchor and before subtotals to compute centers
-    if anchor_page:
-        if subtotals_page:
-            xvals = [w["xmid"] for w in all_words if (w["page_index"] > anchor_page and w["page_index"] < subtotals_page) or (w["page_index"] == anchor_page and w["ymid"] >= anchor_ymid) or (w["page_index"] == subtotals_page and w["ymid"] <= subtotals_ymid)]
-        else:
-            xvals = [w["xmid"] for w in all_words if (w["page_index"] > anchor_page) or (w["page_index"] == anchor_page and w["ymid"] >= anchor_ymid)]
-    else:
-        xvals = [w["xmid"] for w in all_words]
-    centers = kmeans_1d(xvals, 5, iters=40)
-    if not centers:
-        return "<html><body><p>Could not compute columns.</p><a href='/ui'>Back</a></body></html>"
-
-    centers_sorted = sorted(centers)
-    col_names = ["Line", "Op", "Description", "Labor", "Paint"]
-
-    table_rows = ""
-    # process pages in order and append their rows
-    for page_idx, page in enumerate(pages, start=1):
-        # skip pages after subtotals
-        if subtotals_page and page_idx > subtotals_page:
-            continue
-        
-        # ensure per-page xmid/ymid are present
-        for wdict in page.get("words", []):
-            if "xmid" not in wdict:
-                wdict["xmid"] = (wdict["x0"] + wdict["x1"]) / 2.0
-            if "ymid" not in wdict:
-                wdict["ymid"] = (wdict["y0"] + wdict["y1"]) / 2.0
-
-        rows = group_rows(page.get("words", []), y_thresh=6.0)
-        for r in rows:
-            # skip rows above anchor (RO) or at/below subtotals
-            if anchor_page and page_idx == anchor_page and anchor_ymid is not None:
-                if r["ymid"] < anchor_ymid:
-                    continue
-            if subtotals_page and page_idx == subtotals_page and subtotals_ymid is not None:
-                if r["ymid"] >= subtotals_ymid:
-                    continue
-            
-            # sort words in row by x
-            wlist = sorted(r["words"], key=lambda ww: ww["xmid"])
-            cols = {i: [] for i in range(len(centers_sorted))}
-            for ww in wlist:
-                # assign to nearest center
-                best = min(range(len(centers_sorted)), key=lambda c: abs(ww["xmid"] - centers_sorted[c]))
-                cols[best].append(ww)
-
-            # join texts per column
-            vals = []
-            for i in range(len(centers_sorted)):
-                part = " ".join(w["text"] for w in sorted(cols[i], key=lambda z: z["xmid"]))
-                vals.append(part)
-
-            # Filter out header/customer rows: require a leading line number in first column
-            left_col = vals[0].strip() if vals else ""
-            combined_text = " ".join(vals).lower()
-            if not re.search(r"\b\d+\b", left_col):
-                if any(k in combined_text for k in ("customer", "address", "vin", "page", "estimate", "phone", "fax", "ro")):
-                    continue
-                if left_col.lower() in ("line", "line#", "no", "qty"):
-                    continue
-
-            # render only the five columns
-            table_rows += "<tr>"
-            for i in range(5):
-                table_rows += f"<td>{(vals[i] if i < len(vals) else '')}</td>"
-            table_rows += "</tr>"
-
-    header_html = "".join(f"<th>{n}</th>" for n in col_names)
+    # If AJAX request, return just the content without HTML wrapper
+    if ajax:
+        return _grid_content(parsed)
 
-    return f"""
-<html>
-<head><title>Aligned Table</title></head>
-<body style='font-family:Arial; padding:20px;'>
-  <h2>Aligned Table (All Pages)</h2>
-  <table border='1' cellpadding='6' cellspacing='0'>
-    <tr>{header_html}</tr>
-    {table_rows}
-  </table>
-  <br><a href='/ui'>Back</a>
-</body>
-</html>
-"""
\ No newline at end of file
+
+# ---------------------------------------------------------
+# PARSE JOBS (upload returns a job id; progress over Server-Sent Events)
+# ---------------------------------------------------------
+
+# How often the event stream re-reads the job record, and sends a keepalive
+JOB_POLL_SECONDS = 0.25
+JOB_KEEPALIVE_SECONDS = 15.0
+
+
+def _job_or_404(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/jobs")
+async def create_grid_job(file: UploadFile = File(...)):
+    job_id = await start_grid_job(file)
+    return {"job_id": job_id}
+
+
+@router.get("/jobs/{job_id}")
+async def grid_job_status(job_id: str):
+    job = _job_or_404(job_id)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+
+@router.get("/jobs/{job_id}/events")
+async def grid_job_events(job_id: str):
+    _job_or_404(job_id)
+
+    async def events():
+        last_progress = None
+        last_sent = time.monotonic()
+        while True:
+            job = await asyncio.to_thread(get_job, job_id)
+            if job is None:
+                yield _sse("error", {"error": "Job expired"})
+                return
+            if job["progress"] != last_progress:
+                last_progress = job["progress"]
+                last_sent = time.monotonic()
+                yield _sse("progress", {"status": job["status"], **last_progress})
+            if job["status"] == "done":
+                yield _sse("done", job["result"])
+                return
+            if job["status"] == "error":
+                yield _sse("error", {"error": job["error"]})
+                return
+            if time.monotonic() - last_sent >= JOB_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/jobs/{job_id}/grid", response_class=HTMLResponse)
+async def grid_job_content(job_id: str):
+    job = _job_or_404(job_id)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    parsed = await asyncio.to_thread(grid_cache.get, job["cache_key"])
+    if parsed is None:
+        raise HTTPException(status_code=410, detail="Result no longer cached; upload again")
+    return _grid_content(parsed)
+
+
+@router.post("/aligned")
+async def aligned_ui(file: UploadFile = File(...), format: str = "html"):
+    """
+    Aligned table as HTML, CSV or NDJSON (?format=), streamed a page at a
+    time while the worker is still reading later pages.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    # The upload and the worker job live as long as the response body
+    stack = AsyncExitStack()
+    try:
+        upload = await stack.enter_async_context(spool_upload(file))
+        messages = await stack.enter_async_context(aclosing(stream_aligned(upload)))
+        # Wait for the first page, so a bad document still gets a proper error response
+        first = await anext(messages, None)
+    except BaseException:
+        await stack.aclose()
+        raise
+
+    if first is not None and first["type"] == "error":
+        await stack.aclose()
+        error = first["error"]
+        if format == "html":
+            return HTMLResponse(f"<html><body><p>{error}</p><a href='/ui'>Back</a></body></html>")
+        raise HTTPException(status_code=422, detail=error)
+
+    async def body():
+        async with stack:
+            yield export_head(format)
+            if first is not None:
+                yield export_rows(format, first["page"], first["rows"])
+            try:
+                async for message in messages:
+                    yield export_rows(format, message["page"], message["rows"])
+            except Exception as e:
+                print(f"[aligned] export of {upload.sha256[:12]} failed: {e}")
+                yield export_error(format, e.detail if isinstance(e, HTTPException) else str(e))
+                return
+            yield export_tail(format)
+
+    headers = {}
+    if format != "html":
+        headers["Content-Disposition"] = f'attachment; filename="aligned.{format}"'
+    return StreamingResponse(body(), media_type=EXPORT_FORMATS[format], headers=headers)
@@ -2,8 +2,7 @@
 
 from fastapi import APIRouter, UploadFile, File, Request
 from fastapi.responses import HTMLResponse
-from app.services.extractor import extract_text_from_pdf
-from app.services.parser import parse_estimate_text
+from app.services.parse_pool import parse_text_items
 from app.services.grid_processor import kmeans_1d as _kmeans_1d, group_rows as _group_rows
 from app.services.db import get_conn
 import json
@@ -33,7 +32,8 @@ async def upload_form():
 
 @router.post("/parse", response_class=HTMLResponse)
 async def parse_ui(file: UploadFile = File(...)):
-    text = extract_text_from_pdf(file)
+    parsed = await parse_text_items(file)
+    text = parsed["text"]
 
     try:
         print("===EXTRACTED TEXT PREVIEW (truncated)===")
@@ -42,7 +42,7 @@ async def parse_ui(file: UploadFile = File(...)):
     except Exception:
         print("[extractor] could not print text preview")
 
-    items = parse_estimate_text(text)
+    items = parsed["items"]
     print(f"[parser] parsed {len(items)} items")
 
     rows = ""
@@ -17,6 +17,18 @@ def get_upload_screen_html():
 def get_upload_script():
     """Return the JavaScript for handling file uploads."""
     return """
+        function showGrid(statusDiv, html) {
+            statusDiv.innerHTML = html;
+            
+            // Execute any scripts in the loaded content
+            const scripts = statusDiv.querySelectorAll('script');
+            scripts.forEach(oldScript => {
+                const newScript = document.createElement('script');
+                newScript.innerHTML = oldScript.innerHTML;
+                document.body.appendChild(newScript);
+            });
+        }
+        
         function handleFileUpload() {
             const fileInput = document.getElementById('fileInput');
             const file = fileInput.files[0];
@@ -26,23 +38,42 @@ def get_upload_script():
             formData.append('file', file);
             
             const statusDiv = document.getElementById('uploadStatus');
-            statusDiv.innerHTML = '<p>Processing...</p>';
+            statusDiv.innerHTML = '<p>Uploading...</p>';
             
-            fetch('/ui/grid?ajax=true', {
+            // Start a parse job, then follow its progress over Server-Sent Events
+            fetch('/ui/jobs', {
                 method: 'POST',
                 body: formData
             })
-            .then(response => response.text())
-            .then(html => {
-                statusDiv.innerHTML = html;
+            .then(response => response.json().then(data => {
+                if (!response.ok) throw new Error(data.detail || response.statusText);
+                return data;
+            }))
+            .then(data => {
                 fileInput.value = '';
+                statusDiv.innerHTML = '<p>Processing...</p>';
+                const jobId = data.job_id;
+                const events = new EventSource('/ui/jobs/' + jobId + '/events');
                 
-                // Execute any scripts in the loaded content
-                const scripts = statusDiv.querySelectorAll('script');
-                scripts.forEach(oldScript => {
-                    const newScript = document.createElement('script');
-                    newScript.innerHTML = oldScript.innerHTML;
-                    document.body.appendChild(newScript);
+                events.addEventListener('progress', e => {
+                    const progress = JSON.parse(e.data);
+                    if (progress.pages) {
+                        statusDiv.innerHTML = '<p>Processing page ' + progress.page + ' of ' + progress.pages + '...</p>';
+                    }
+                });
+                events.addEventListener('done', () => {
+                    events.close();
+                    fetch('/ui/jobs/' + jobId + '/grid')
+                        .then(response => response.text())
+                        .then(html => showGrid(statusDiv, html))
+                        .catch(error => {
+                            statusDiv.innerHTML = '<p>Error: ' + error.message + '</p>';
+                        });
+                });
+                events.addEventListener('error', e => {
+                    events.close();
+                    const message = e.data ? JSON.parse(e.data).error : 'Lost connection to the server';
+                    statusDiv.innerHTML = '<p>Error: ' + message + '</p>';
                 });
             })
             .catch(error => {
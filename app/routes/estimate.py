@@ -1,23 +1,200 @@
-from fastapi import APIRouter, UploadFile, File, Request
-from app.services.extractor import load_pdf
-from app.services.parser import parse_estimate_pdf
+import json
+import os
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
+from app.services.parse_pool import parse_batch, parse_estimate, parse_grid, stream_line_items
+from app.services.parse_cache import grid_cache
+from app.services import operations, sandbox, single_flight
 from app.models.estimate import EstimateResponse
+from app.services.supplements import RO_NUMBER_SQL_PATTERN, apply_item_diff, diff_items, diff_summary, ro_number
+from app.services.uploads import spool_batch, spool_upload
 from app.services.db import get_conn
 
 router = APIRouter()
 
+@router.post("/parse", response_model=EstimateResponse)
+async def parse_upload(file: UploadFile = File(...)):
+    """
+    Parse one PDF into line items with labor and paint hours together, plus
+    totals. Same pipeline and cache as the grid view, across all pages.
+    """
+    return await parse_estimate(file)
+
+
 @router.post("/parse-labor", response_model=EstimateResponse)
 async def parse_labor(file: UploadFile = File(...)):
-    doc = load_pdf(file)
-    parsed = parse_estimate_pdf(doc)
-    return {"line_items": parsed["labor"]}
+    parsed = await parse_estimate(file)
+    parsed.line_items = [item for item in parsed.line_items if item.labor is not None]
+    return parsed
 
 
 @router.post("/parse-paint", response_model=EstimateResponse)
 async def parse_paint(file: UploadFile = File(...)):
-    doc = load_pdf(file)
-    parsed = parse_estimate_pdf(doc)
-    return {"line_items": parsed["paint"]}
+    parsed = await parse_estimate(file)
+    parsed.line_items = [item for item in parsed.line_items if item.paint is not None]
+    return parsed
+
+
+@router.post("/parse-batch")
+async def parse_batch_upload(files: List[UploadFile] = File(...)):
+    """
+    Grid-parse many PDFs (or ZIPs of PDFs) in parallel. Streams NDJSON, one
+    line per document in completion order; rejected files get an "error" line.
+    """
+    # Spool everything before responding: the UploadFiles close once the handler returns
+    stack = AsyncExitStack()
+    entries = await stack.enter_async_context(spool_batch(files))
+
+    async def lines():
+        async with stack:
+            async for doc in parse_batch(entries):
+                yield json.dumps(doc) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/parse-items")
+async def parse_items_stream(file: UploadFile = File(...)):
+    """
+    Grid-parse one PDF and stream its labor/paint items as NDJSON while later
+    pages are still being read: one "item" line per item (with its page),
+    a "region" line, then "done" with the totals, or "error".
+    """
+    stack = AsyncExitStack()
+    upload = await stack.enter_async_context(spool_upload(file))
+
+    async def lines():
+        async with stack:
+            async for line in stream_line_items(upload):
+                yield json.dumps(line) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/parse-cache/stats")
+async def parse_cache_stats():
+    """
+    Hit/miss/eviction counters for this server process's parse cache, plus
+    worker kill counts and rows matched per operation rule.
+    """
+    return {
+        "pid": os.getpid(),
+        "grid": grid_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "sandbox": sandbox.stats(),
+        "operations": operations.stats(),
+    }
+
+
+# ============================================
+# SUPPLEMENTS
+# ============================================
+
+def _stored_items(value) -> List[Dict]:
+    """assigned/unassigned column value (JSON text, or already decoded) as a list."""
+    if isinstance(value, str):
+        return json.loads(value) if value else []
+    return value or []
+
+
+def _hours(items: List[Dict]) -> float:
+    return sum(float(item.get("value") or 0) for item in items)
+
+
+def _update_assignments(cur, table: str, total_column: str, ro: str, result: Dict, items: List[Dict]) -> Optional[Dict]:
+    """
+    Apply a supplement to the saved assignment rows of an RO. Every save
+    holds the whole estimate split into assigned and unassigned, so the
+    latest row is the RO's last stored parse: it is diffed once against the
+    new parse, and the delta applied to each row holding an affected line.
+    Added lines go once, to the latest row's unassigned pool. Returns the
+    diff and the ids of the rewritten rows, or None with no saved rows.
+    """
+    # The RO line changes with each supplement ("... Supplement S02"); match on the number
+    cur.execute(f"""
+        SELECT id, ro, tech, assigned, unassigned, {total_column} AS total
+        FROM {table}
+        WHERE substring(ro from %s) = %s
+        ORDER BY timestamp, id
+    """, (RO_NUMBER_SQL_PATTERN, ro))
+    rows = cur.fetchall()
+    if not rows:
+        return None
+
+    latest = rows[-1]
+    diff = diff_items(_stored_items(latest["assigned"]) + _stored_items(latest["unassigned"]), items)
+    summary = diff_summary(diff)
+
+    updated = []
+    for row in rows:
+        old_assigned = _stored_items(row["assigned"])
+        old_unassigned = _stored_items(row["unassigned"])
+        assigned, unassigned = apply_item_diff(old_assigned, old_unassigned, diff, add=row is latest)
+        if assigned == old_assigned and unassigned == old_unassigned:
+            continue
+
+        # Additional hours are the estimator's own, so the total moves only by the assigned delta
+        total = float(row["total"] or 0) + _hours(assigned) - _hours(old_assigned)
+        cur.execute(f"""
+            UPDATE {table}
+            SET ro = %s, vehicle = %s, assigned = %s, unassigned = %s,
+                {total_column} = %s, total_unassigned = %s, timestamp = %s
+            WHERE id = %s
+        """, (
+            result["second_ro_line"],
+            result["vehicle_info_line"],
+            json.dumps(assigned),
+            json.dumps(unassigned),
+            total,
+            _hours(unassigned),
+            datetime.now(timezone.utc),
+            row["id"],
+        ))
+        updated.append(row["id"])
+    return {**summary, "rows": len(rows), "updated": updated, "diff": diff}
+
+
+@router.post("/supplement")
+async def apply_supplement(file: UploadFile = File(...)):
+    """
+    Parse a supplement and update the RO's saved labor/refinish assignments
+    with only what changed: added lines go to unassigned, changed lines keep
+    their tech with the new hours, removed lines are dropped. Returns the
+    labor and refinish diffs; null where the RO has no saved assignments.
+    """
+    parsed = await parse_grid(file)
+    result = parsed["result"]
+    if result is None:
+        raise HTTPException(status_code=422, detail="No words found in PDF.")
+    ro = ro_number(result["second_ro_line"])
+    if ro is None:
+        raise HTTPException(status_code=422, detail="No RO number found in the estimate.")
+
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        labor = _update_assignments(cur, "labor_assignments", "total_labor", ro, result, result["labor_items"])
+        refinish = _update_assignments(cur, "refinish_assignments", "total_paint", ro, result, result["paint_items"])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    print(
+        f"[supplement] RO {ro}: {len((labor or {}).get('updated', []))} labor and "
+        f"{len((refinish or {}).get('updated', []))} refinish assignment(s) updated"
+    )
+    return {
+        "ro": ro,
+        "second_ro_line": result["second_ro_line"],
+        "labor": labor,
+        "refinish": refinish,
+    }
 
 
 # ============================================
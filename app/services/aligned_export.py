@@ -0,0 +1,79 @@
+"""Aligned-table export formats, written page by page.
+
+Each format is a head, a chunk per page of rows and a tail, so a response
+can be streamed while the parse worker is still producing later pages.
+"""
+
+import csv
+import html
+import io
+import json
+from typing import List
+
+from app.services.grid_processor import ALIGNED_COLUMNS
+
+# format -> media type
+EXPORT_FORMATS = {
+    "html": "text/html; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+_NDJSON_KEYS = tuple(name.lower() for name in ALIGNED_COLUMNS)
+
+
+def export_head(fmt: str) -> str:
+    if fmt == "html":
+        header_html = "".join(f"<th>{name}</th>" for name in ALIGNED_COLUMNS)
+        return f"""
+<html>
+<head><title>Aligned Table</title></head>
+<body style='font-family:Arial; padding:20px;'>
+  <h2>Aligned Table (All Pages)</h2>
+  <table border='1' cellpadding='6' cellspacing='0'>
+    <tr>{header_html}</tr>
+"""
+    if fmt == "csv":
+        return _csv_lines([list(ALIGNED_COLUMNS)])
+    return ""
+
+
+def export_rows(fmt: str, page: int, rows: List[List[str]]) -> str:
+    """One page of rows in the given format."""
+    if fmt == "html":
+        return "".join(
+            "<tr>" + "".join(f"<td>{html.escape(val, quote=False)}</td>" for val in vals) + "</tr>\n"
+            for vals in rows
+        )
+    if fmt == "csv":
+        return _csv_lines(rows)
+    return "".join(json.dumps({"page": page, **dict(zip(_NDJSON_KEYS, vals))}) + "\n" for vals in rows)
+
+
+def export_tail(fmt: str) -> str:
+    if fmt == "html":
+        return """  </table>
+  <br><a href='/ui'>Back</a>
+</body>
+</html>
+"""
+    return ""
+
+
+def export_error(fmt: str, message: str) -> str:
+    """
+    A failure after the response has started. CSV has no way to say so; the
+    file just ends early.
+    """
+    if fmt == "html":
+        return f"  </table>\n  <p>{html.escape(message)}</p>\n</body>\n</html>\n"
+    if fmt == "ndjson":
+        return json.dumps({"type": "error", "error": message}) + "\n"
+    return ""
+
+
+def _csv_lines(rows: List[List[str]]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue()
+
@@ -0,0 +1,99 @@
+"""Column assignment by binary search over sorted column boundaries.
+
+Two lookups from word x-midpoints to columns:
+
+- ColumnBands: named open x-intervals (a header column +- a tolerance, or an
+  explicit span such as the description area). Bands may overlap, so a word
+  can belong to several. Used by the grid's labor/paint extraction.
+- NearestColumns: the nearest of a set of centers (k-means output). Used by
+  the aligned table.
+
+The boundaries are sorted once per document and every word is then one
+searchsorted lookup, instead of a scan over all columns per word.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class ColumnBands:
+    """
+    Open intervals (lo, hi) by name. The sorted interval edges split the x
+    axis into open segments and the edge points themselves; which bands
+    contain each of those is precomputed, so membership of a word is the
+    entry for its position among the edges.
+    """
+
+    def __init__(self, bands: Dict[str, Optional[Tuple[float, float]]]):
+        self.names = list(bands)
+        spans = [bands[name] for name in self.names]
+        live = [span for span in spans if span is not None and span[0] < span[1]]
+        self.edges = np.unique(np.array([x for span in live for x in span], dtype=np.float64))
+
+        n_edges = len(self.edges)
+        # Entries 0..n_edges: the open segment left of edges[s]; then the point edges[p].
+        # Each entry is a bit set of the bands containing it.
+        self._codes = np.zeros(2 * n_edges + 1, dtype=np.int64)
+        below = np.concatenate(([-np.inf], self.edges))
+        above = np.concatenate((self.edges, [np.inf]))
+        for b, span in enumerate(spans):
+            if span is None or span[0] >= span[1]:
+                continue
+            lo, hi = span
+            self._codes[: n_edges + 1] |= ((lo <= below) & (above <= hi)).astype(np.int64) << b
+            self._codes[n_edges + 1:] |= ((lo < self.edges) & (self.edges < hi)).astype(np.int64) << b
+
+    @classmethod
+    def around(
+        cls,
+        centers: Dict[str, Optional[float]],
+        tol: float,
+        spans: Optional[Dict[str, Optional[Tuple[float, float]]]] = None,
+    ) -> "ColumnBands":
+        """Bands of +- tol around each center (missing centers give empty bands), plus explicit spans."""
+        bands = {name: (c - tol, c + tol) if c is not None else None for name, c in centers.items()}
+        bands.update(spans or {})
+        return cls(bands)
+
+    def members(self, xs: np.ndarray) -> Dict[str, np.ndarray]:
+        """Boolean mask per band: which of xs lie strictly inside it."""
+        xs = np.asarray(xs, dtype=np.float64)
+        n_edges = len(self.edges)
+        if n_edges == 0:
+            return {name: np.zeros(len(xs), dtype=bool) for name in self.names}
+
+        pos = np.searchsorted(self.edges, xs, side="left")
+        pos[self.edges.take(pos, mode="clip") == xs] += n_edges + 1
+        hits = self._codes.take(pos)
+        return {name: (hits & (1 << b)) != 0 for b, name in enumerate(self.names)}
+
+
+class NearestColumns:
+    """Nearest-center assignment; ties go to the lower (leftmost) center, as min() over the centers would."""
+
+    def __init__(self, centers: Sequence[float]):
+        self.centers = np.sort(np.asarray(centers, dtype=np.float64))
+        # Duplicate centers: min() would always pick the first of them
+        self._first = np.searchsorted(self.centers, self.centers, side="left")
+
+    def __len__(self) -> int:
+        return len(self.centers)
+
+    def assign(self, xs: Sequence[float]) -> List[int]:
+        """Index (into the sorted centers) of the nearest center for each x."""
+        xs = np.asarray(xs, dtype=np.float64)
+        if len(xs) == 0 or len(self.centers) == 0:
+            return []
+        if len(self.centers) == 1:
+            return [0] * len(xs)
+
+        # The nearest center is one of the two around x; compare distances the way min() does
+        right = np.clip(np.searchsorted(self.centers, xs, side="left"), 1, len(self.centers) - 1)
+        left = right - 1
+        pick = np.where(
+            np.abs(xs - self.centers[right]) < np.abs(xs - self.centers[left]),
+            right,
+            left,
+        )
+        return self._first[pick].tolist()
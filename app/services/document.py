@@ -0,0 +1,139 @@
+"""One open PDF per request, with one TextPage per page shared by every consumer."""
+
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import fitz
+
+from app.services.ocr import ocr_pages
+
+# Words/text flags; image blocks are left out, the parsers only read text blocks
+TEXTPAGE_FLAGS = fitz.TEXTFLAGS_WORDS
+
+
+def load_pdf(file):
+    """Open a PDF by path (uploads are spooled to disk first) or from raw bytes."""
+    if isinstance(file, (bytes, bytearray)):
+        return fitz.open(stream=file, filetype="pdf")
+    return fitz.open(file, filetype="pdf")
+
+
+class ParsedDocument:
+    """
+    A PDF opened once. Pages and their TextPages are built lazily and kept
+    until close(), so plain text, words and text search all come from the
+    same TextPage. Use as a context manager to close it deterministically.
+    """
+
+    def __init__(self, source):
+        self.doc = load_pdf(source)
+        self._pages: Dict[int, Any] = {}
+        self._textpages: Dict[int, Any] = {}
+        self._needs_ocr: Dict[int, bool] = {}
+        self._ocr_words: Dict[int, List[tuple]] = {}
+
+    def __enter__(self) -> "ParsedDocument":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.doc.page_count
+
+    @property
+    def page_count(self) -> int:
+        return self.doc.page_count
+
+    def page(self, pno: int):
+        """Page object for pno (0-based). Held here because a TextPage only weakly references it."""
+        if pno not in self._pages:
+            self._pages[pno] = self.doc[pno]
+        return self._pages[pno]
+
+    def pages(self):
+        for pno in range(self.page_count):
+            yield self.page(pno)
+
+    def textpage(self, pno: int):
+        """The page's TextPage, built on first use."""
+        if pno not in self._textpages:
+            self._textpages[pno] = self.page(pno).get_textpage(flags=TEXTPAGE_FLAGS)
+        return self._textpages[pno]
+
+    def text(self, pno: Optional[int] = None) -> str:
+        """Plain text of one page, or of the whole document."""
+        if pno is not None:
+            return self.textpage(pno).extractText()
+        return "".join(self.text(i) for i in range(self.page_count))
+
+    def needs_ocr(self, pno: int) -> bool:
+        """True for scanned pages: no text layer, but at least one image."""
+        if pno not in self._needs_ocr:
+            self._needs_ocr[pno] = not self.text(pno).strip() and bool(self.page(pno).get_images())
+        return self._needs_ocr[pno]
+
+    def _ocr(self, pno: int, ahead: bool = True) -> List[tuple]:
+        if pno not in self._ocr_words:
+            # Batch every scanned page from here on so they OCR in parallel
+            last = self.page_count if ahead else pno + 1
+            batch = {
+                i: self.page(i)
+                for i in range(pno, last)
+                if i not in self._ocr_words and self.needs_ocr(i)
+            }
+            self._ocr_words.update(ocr_pages(batch))
+        return self._ocr_words[pno]
+
+    def words(self, pno: int, clip=None) -> List[tuple]:
+        """
+        Word tuples (x0, y0, x1, y1, text, block_no, line_no, word_no), optionally
+        clipped. Scanned pages are OCR'd and return the same tuple shape.
+        The clip is applied to the page's shared, full-page TextPage: the
+        anchor-first extractor has already built it to search the page's text.
+        """
+        if self.needs_ocr(pno):
+            words = self._ocr(pno)
+            if clip is not None:
+                # Same rule PyMuPDF applies: keep words at least half inside the clip
+                clip = fitz.Rect(clip)
+                words = [w for w in words if abs(clip & w[:4]) >= 0.5 * abs(fitz.Rect(w[:4]))]
+            return words
+        return self.page(pno).get_text("words", clip=clip, textpage=self.textpage(pno))
+
+    def page_text(self, pno: int, ahead: bool = True) -> str:
+        """
+        Text of a page from its text layer, or from OCR for scanned pages.
+        Without ahead, a scanned page is OCR'd on its own instead of in a
+        batch with the scanned pages after it.
+        """
+        if self.needs_ocr(pno):
+            return " ".join(w[4] for w in self._ocr(pno, ahead))
+        return self.text(pno)
+
+    def search(self, pno: int, needle: str) -> List[Any]:
+        """Rects of case-insensitive matches of needle on the page."""
+        return self.page(pno).search_for(needle, textpage=self.textpage(pno))
+
+    def close(self):
+        self._ocr_words.clear()
+        self._textpages.clear()
+        self._pages.clear()
+        if not self.doc.is_closed:
+            self.doc.close()
+
+
+@contextmanager
+def borrow_document(source):
+    """
+    Yield a ParsedDocument for source. An existing ParsedDocument is passed
+    through untouched; anything else is opened here and closed on exit.
+    """
+    if isinstance(source, ParsedDocument):
+        yield source
+        return
+    doc = ParsedDocument(source)
+    try:
+        yield doc
+    finally:
+        doc.close()
@@ -1,39 +1,281 @@
+import hashlib
+import re
+
 import fitz
 
-def load_pdf(file):
-    file.file.seek(0)
-    pdf_bytes = file.file.read()
-    return fitz.open(stream=pdf_bytes, filetype="pdf")
+from app.services.document import borrow_document
+from app.services.grid_processor import HEADER_TOKENS, PARSER_VERSION, group_rows
+from app.services.parse_cache import cache_key, page_cache
 
 def extract_text_from_pdf(file):
-    """Extract raw text from a PDF file."""
-    doc = load_pdf(file)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    doc.close()
-    return text
+    """Extract raw text from a PDF file (path, bytes or ParsedDocument)."""
+    with borrow_document(file) as doc:
+        return doc.text()
 
-def extract_words_from_pdf(file):
-    """Extract words with positions from a PDF file, organized by page."""
-    doc = load_pdf(file)
-    pages = []
-    for page_num, page in enumerate(doc):
-        page_rect = page.rect
-        words = page.get_text("words")  # Returns list of (x0, y0, x1, y1, "word", block_no, line_no, word_no)
-        page_words = []
-        for word in words:
-            page_words.append({
-                "x0": word[0],
-                "y0": word[1],
-                "x1": word[2],
-                "y1": word[3],
-                "text": word[4]
-            })
-        pages.append({
-            "words": page_words,
-            "width": page_rect.width,
-            "height": page_rect.height
+def page_content_hash(page) -> str:
+    """
+    Hash everything that determines a page's words: its content stream, form
+    XObjects, images, fonts and geometry. Reprinted supplement pages hash the same.
+    """
+    doc = page.parent
+    h = hashlib.sha256()
+    h.update(page.read_contents())
+    for xobj in page.get_xobjects():
+        h.update(doc.xref_stream_raw(xobj[0]) or b"")
+    # Scans share one content stream ("draw image"); the image data tells them apart
+    for img in page.get_images():
+        h.update(doc.xref_stream_raw(img[0]) or b"")
+    fonts = [f[1:] for f in page.get_fonts()]
+    h.update(repr((tuple(page.rect), page.rotation, fonts)).encode())
+    return h.hexdigest()
+
+SUBSET_TAG = re.compile(r"^[A-Z]{6}\+")
+
+def page_fonts(page):
+    """Base font names used on a page, without subset tags (ABCDEF+), for layout fingerprints."""
+    return sorted({SUBSET_TAG.sub("", f[3]) for f in page.get_fonts() if f[3]})
+
+def header_positions(doc, pno):
+    """
+    Rounded x0 of each header token (LINE, OPER, DESCRIPTION, LABOR, PAINT)
+    on the page's header row, found by text search over the whole page, for
+    layout fingerprints. Empty when no row has all of them (or for scans).
+    """
+    if doc.needs_ocr(pno):
+        return []
+    hits = {token: doc.search(pno, token) for token in HEADER_TOKENS}
+    for rect in hits["DESCRIPTION"]:
+        ymid = (rect.y0 + rect.y1) / 2
+        row = []
+        for token in HEADER_TOKENS:
+            same_row = [r.x0 for r in hits[token] if abs((r.y0 + r.y1) / 2 - ymid) <= 3.0]
+            if not same_row:
+                break
+            row.append(round(min(same_row)))
+        else:
+            return row
+    return []
+
+def _words_to_dicts(words):
+    page_words = []
+    for word in words:
+        page_words.append({
+            "x0": word[0],
+            "y0": word[1],
+            "x1": word[2],
+            "y1": word[3],
+            "text": word[4]
         })
-    doc.close()
-    return pages
\ No newline at end of file
+    return page_words
+
+def _extract_page_words(doc, pno, clip=None):
+    """Run PyMuPDF word extraction (optionally clipped) and row grouping for one page."""
+    # Returns list of (x0, y0, x1, y1, "word", block_no, line_no, word_no)
+    words = doc.words(pno, clip=clip)
+    page_words = _words_to_dicts(words)
+    # Rows are stored as word indices so the cached entry stays flat
+    index = {id(w): i for i, w in enumerate(page_words)}
+    rows = [
+        {"ymid": r["ymid"], "words": [index[id(w)] for w in r["words"]]}
+        for r in group_rows(page_words, y_thresh=6.0)
+    ]
+    return {"words": page_words, "rows": rows, "header": header_positions(doc, pno)}
+
+def _cached_page_words(doc, pno, content_hash, clip=None):
+    """Words and rows for a page (region), from the page cache when possible."""
+    page = doc.page(pno)
+    key = cache_key(content_hash, PARSER_VERSION)
+    if clip is not None:
+        key += "-clip-%.1f-%.1f" % (clip.y0, clip.y1)
+    cached = page_cache.get(key)
+    if cached is None:
+        cached = _extract_page_words(doc, pno, clip=clip)
+        page_cache.put(key, cached)
+
+    # Copy the word dicts: the grid pipeline annotates them per document
+    page_words = [dict(w) for w in cached["words"]]
+    return {
+        "words": page_words,
+        "rows": [
+            {"ymid": r["ymid"], "words": [page_words[i] for i in r["words"]]}
+            for r in cached["rows"]
+        ],
+        # The same rows as word indices, for the grid's row index
+        "row_index": cached["rows"],
+        "width": page.rect.width,
+        "height": page.rect.height,
+        "fonts": page_fonts(page),
+        "header": cached["header"],
+        "content_hash": content_hash,
+    }
+
+def extract_words_from_pdf(file):
+    """
+    Extract words with positions from a PDF file, organized by page.
+    Pages seen before (by content hash) reuse their cached words and rows.
+    """
+    with borrow_document(file) as doc:
+        return [
+            _cached_page_words(doc, pno, page_content_hash(doc.page(pno)))
+            for pno in range(doc.page_count)
+        ]
+
+
+# ---------------------------------------------------------
+# ANCHOR-FIRST EXTRACTION
+# ---------------------------------------------------------
+
+# Extra height read above the anchor and below the totals row; the grid
+# pipeline applies the exact cut-offs itself
+REGION_MARGIN = 20.0
+
+RO_PATTERN = re.compile(r"\bRO\b")
+TOTALS_PATTERN = re.compile(r"\bESTIMATE\s+TOTALS\b")
+
+def _page_markers(doc, pno):
+    """
+    RO rows and the ESTIMATE TOTALS row on one page, found in the page's
+    rows as group_rows builds them over the whole page (the rows
+    detect_anchors_and_vehicle_info reads, so wrapped rows match too).
+    Plain-text search rules out most pages; only pages with a hit have their
+    words read and grouped.
+    """
+    markers = {"ro_rows": [], "totals_ymid": None}
+    text = doc.page_text(pno)
+    has_ro = RO_PATTERN.search(text) is not None
+    has_totals = TOTALS_PATTERN.search(text) is not None
+    if not has_ro and not has_totals:
+        return markers
+
+    # Rows come out in y order, so RO rows are sorted and the first totals row is the topmost
+    for row in group_rows(_words_to_dicts(doc.words(pno)), y_thresh=6.0):
+        row_text = " ".join(w["text"] for w in row["words"]).strip()
+        if has_ro and RO_PATTERN.search(row_text):
+            markers["ro_rows"].append(row["ymid"])
+        if has_totals and markers["totals_ymid"] is None and TOTALS_PATTERN.search(row_text):
+            markers["totals_ymid"] = row["ymid"]
+
+    return markers
+
+def _cached_markers(doc, pno, content_hash):
+    key = cache_key(content_hash, PARSER_VERSION) + "-markers"
+    markers = page_cache.get(key)
+    if markers is None:
+        markers = _page_markers(doc, pno)
+        page_cache.put(key, markers)
+    return markers
+
+def _note_markers(region, markers, pno, ro_count):
+    """Record an anchor (second RO row) or first totals row on page pno; returns the RO count so far."""
+    for ymid in markers["ro_rows"]:
+        ro_count += 1
+        if ro_count == 2 and not region["anchor_page"]:
+            region["anchor_page"] = pno + 1
+            region["anchor_ymid"] = ymid
+
+    if not region["subtotals_page"] and markers["totals_ymid"] is not None:
+        region["subtotals_page"] = pno + 1
+        region["subtotals_ymid"] = markers["totals_ymid"]
+    return ro_count
+
+def locate_line_item_region(doc, hashes):
+    """
+    Phase one: find the second RO row (anchor) and the ESTIMATE TOTALS row
+    with page-level text search. Returns the same anchor/subtotals fields
+    detect_anchors_and_vehicle_info reports. Fills hashes for the pages it
+    visited so phase two can reuse them.
+    """
+    region = {"anchor_page": None, "anchor_ymid": None, "subtotals_page": None, "subtotals_ymid": None}
+    ro_count = 0
+
+    for pno in range(doc.page_count):
+        hashes[pno] = page_content_hash(doc.page(pno))
+        ro_count = _note_markers(region, _cached_markers(doc, pno, hashes[pno]), pno, ro_count)
+        if region["anchor_page"] and region["subtotals_page"]:
+            break
+
+    return region
+
+def _region_page_words(doc, pi, region, content_hash=None):
+    """
+    Words of page pi (1-based) inside the region: empty before the anchor
+    page, clipped (with a margin) on the anchor and totals pages.
+    """
+    anchor_page = region["anchor_page"]
+    anchor_ymid = region["anchor_ymid"]
+    subtotals_page = region["subtotals_page"]
+    subtotals_ymid = region["subtotals_ymid"]
+
+    page = doc.page(pi - 1)
+    if anchor_page and pi < anchor_page:
+        return {"words": [], "rows": [], "width": page.rect.width, "height": page.rect.height}
+
+    clip = None
+    if (anchor_page and pi == anchor_page) or (subtotals_page and pi == subtotals_page):
+        top = page.rect.y0
+        bottom = page.rect.y1
+        if anchor_page and pi == anchor_page:
+            top = max(top, anchor_ymid - REGION_MARGIN)
+        if subtotals_page and pi == subtotals_page:
+            bottom = min(bottom, subtotals_ymid + REGION_MARGIN)
+        clip = fitz.Rect(page.rect.x0, top, page.rect.x1, bottom)
+
+    return _cached_page_words(doc, pi - 1, content_hash or page_content_hash(page), clip=clip)
+
+def extract_line_item_pages(file, on_page=None):
+    """
+    Two-phase extraction for the grid view: locate the line-item region, then
+    read words only inside it. Pages before the anchor come back empty and
+    pages after the totals page are never read.
+    on_page(done, total) is called after each page. Returns (pages, region).
+    """
+    with borrow_document(file) as doc:
+        hashes = {}
+        region = locate_line_item_region(doc, hashes)
+        last_page = region["subtotals_page"] or doc.page_count
+
+        pages = []
+        for pi in range(1, last_page + 1):
+            pages.append(_region_page_words(doc, pi, region, hashes.get(pi - 1)))
+            if on_page and not (region["anchor_page"] and pi < region["anchor_page"]):
+                on_page(pi, last_page)
+
+        return pages, region
+
+def iter_line_item_pages(file, region):
+    """
+    Single-pass form of extract_line_item_pages for streaming: markers and
+    words are read page by page, so pages come out before the totals page has
+    been found. region is filled in as markers turn up; when a page is
+    yielded, everything in region that decides its words is already final
+    (the anchor fields, and the totals fields if this is the totals page).
+    Pages are held back only while the anchor is still unknown. Yields the
+    same pages as extract_line_item_pages.
+    """
+    region.update(anchor_page=None, anchor_ymid=None, subtotals_page=None, subtotals_ymid=None)
+    with borrow_document(file) as doc:
+        ro_count = 0
+        hashes = {}
+        read = 0  # pages yielded so far
+
+        for pno in range(doc.page_count):
+            hashes[pno] = page_content_hash(doc.page(pno))
+            ro_count = _note_markers(region, _cached_markers(doc, pno, hashes[pno]), pno, ro_count)
+            if not region["anchor_page"]:
+                # Without the anchor, earlier pages may come back empty or not at all
+                continue
+
+            last_page = pno + 1
+            if region["subtotals_page"]:
+                last_page = min(last_page, region["subtotals_page"])
+            while read < last_page:
+                read += 1
+                yield _region_page_words(doc, read, region, hashes.get(read - 1))
+            if region["subtotals_page"]:
+                return
+
+        # No anchor (or the document ended first): the rest, as phase two would read it
+        last_page = region["subtotals_page"] or doc.page_count
+        while read < last_page:
+            read += 1
+            yield _region_page_words(doc, read, region, hashes.get(read - 1))
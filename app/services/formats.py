@@ -0,0 +1,153 @@
+"""Estimate-format registry.
+
+Each estimating system prints its own layout, so each gets its own entry: a
+fingerprint over the first page's text and the pipelines that read that
+layout. A document is matched against the registry right after it is
+opened, before any words are extracted, so unsupported estimates fail in
+milliseconds instead of after a full grid parse.
+
+Formats are matched in two passes: brand markers first (the system's own
+name or a field only it prints), then layout fallbacks for estimates whose
+first page carries no brand.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Pattern
+
+from app.services.extractor import extract_line_item_pages, iter_line_item_pages, page_content_hash
+from app.services.grid_processor import RO_PATTERN, iter_line_items, page_fragments, process_pdf_grid, tile_fragments
+from app.services.sandbox import JobRejected
+from app.services.tiles import tile_key, tiles_enabled
+
+
+class UnsupportedFormat(JobRejected):
+    """The document is not an estimate format this service can read."""
+
+
+@dataclass(frozen=True)
+class EstimateFormat:
+    name: str
+    label: str
+    # Brand markers: decisive when found anywhere on the first page
+    markers: Pattern
+    # Fallback for unbranded first pages; checked only if no format's markers match
+    layout: Optional[Callable[[str], bool]] = None
+    # (doc, on_page, key) -> {"result", "pages"}, key being the document's grid
+    # cache key; None if the format isn't supported yet
+    grid: Optional[Callable[..., Dict[str, Any]]] = None
+    # (doc, region) -> labor/paint items as their pages are read
+    line_items: Optional[Callable[..., Iterator[Dict[str, Any]]]] = None
+
+    @property
+    def supported(self) -> bool:
+        return self.grid is not None
+
+
+_FORMATS: List[EstimateFormat] = []
+
+
+def register_format(fmt: EstimateFormat) -> EstimateFormat:
+    """Add a format; earlier registrations win when two match."""
+    if any(f.name == fmt.name for f in _FORMATS):
+        raise ValueError(f"Estimate format {fmt.name!r} is already registered.")
+    _FORMATS.append(fmt)
+    return fmt
+
+
+def registered_formats() -> List[EstimateFormat]:
+    return list(_FORMATS)
+
+
+def detect_format(first_page_text: str) -> Optional[EstimateFormat]:
+    """The registered format whose fingerprint matches the first page's text, or None."""
+    for fmt in _FORMATS:
+        if fmt.markers.search(first_page_text):
+            return fmt
+    for fmt in _FORMATS:
+        if fmt.layout is not None and fmt.layout(first_page_text):
+            return fmt
+    return None
+
+
+def format_for(doc) -> EstimateFormat:
+    """
+    Fingerprint an open ParsedDocument from its first page's text (OCR'd for
+    scans, that page only) and return its format. Raises UnsupportedFormat
+    for unknown documents and for formats without a pipeline.
+    """
+    text = doc.page_text(0, ahead=False) if doc.page_count else ""
+    fmt = detect_format(text)
+    if fmt is None:
+        raise UnsupportedFormat("PDF is not a recognized estimate format.")
+    if not fmt.supported:
+        raise UnsupportedFormat(f"{fmt.label} estimates are not supported yet.")
+    return fmt
+
+
+# ---------------------------------------------------------
+# CCC ONE
+# ---------------------------------------------------------
+
+def _ccc_grid(doc, on_page=None, key: str = "") -> Dict[str, Any]:
+    pages, region = extract_line_item_pages(doc, on_page=on_page)
+    if not pages:
+        return {"result": None, "pages": []}
+
+    result = process_pdf_grid(pages, region)
+    anchor_page = result["anchor_page"]
+    subtotals_page = result["subtotals_page"]
+    if not tiles_enabled():
+        fragments = page_fragments(
+            pages,
+            anchor_page,
+            result["anchor_ymid"],
+            subtotals_page,
+            result["subtotals_ymid"],
+        )
+        return {"result": result, "pages": fragments}
+
+    # Tiles are only named here; the tile route renders each one when it is first requested
+    tiles = {}
+    for pi, page in enumerate(pages, start=1):
+        if (anchor_page and pi < anchor_page) or (subtotals_page and pi > subtotals_page):
+            continue
+        tiles[pi] = tile_key(page.get("content_hash") or page_content_hash(doc.page(pi - 1)))
+    fragments = tile_fragments(pages, anchor_page, subtotals_page, result["item_rows"], tiles, key)
+    return {"result": result, "pages": fragments}
+
+
+def _ccc_line_items(doc, region) -> Iterator[Dict[str, Any]]:
+    return iter_line_items(iter_line_item_pages(doc, region), region)
+
+
+def _ccc_layout(text: str) -> bool:
+    # The grid pipeline anchors on RO rows; without one there is nothing to read
+    return RO_PATTERN.search(text) is not None
+
+
+CCC = register_format(EstimateFormat(
+    name="ccc",
+    label="CCC ONE",
+    markers=re.compile(r"\bCCC\s+(?:ONE|Information\s+Services|Intelligent\s+Solutions)\b|\bWorkfile\s+ID\b", re.I),
+    layout=_ccc_layout,
+    grid=_ccc_grid,
+    line_items=_ccc_line_items,
+))
+
+
+# ---------------------------------------------------------
+# RECOGNIZED, NOT YET SUPPORTED
+# ---------------------------------------------------------
+
+MITCHELL = register_format(EstimateFormat(
+    name="mitchell",
+    label="Mitchell",
+    markers=re.compile(r"\bMitchell\s+(?:International|Cloud\s+Estimating|Data\s+Version)\b|\bUltraMate\b", re.I),
+))
+
+AUDATEX = register_format(EstimateFormat(
+    name="audatex",
+    label="Audatex",
+    markers=re.compile(r"\bAudatex\b|\bAudaEnterprise(?:Gold)?\b|\bQapter\b", re.I),
+))
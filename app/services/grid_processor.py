@@ -1,69 +1,50 @@
+import hashlib
 import re
-from typing import List, Dict, Any, Tuple, Optional
-
-
-def kmeans_1d(values: List[float], k: int, iters: int = 40) -> List[float]:
-    """
-    Simple 1D k-means clustering to find k cluster centers.
-    Returns sorted list of k centers.
-    """
-    if not values or k <= 0:
-        return []
-    
-    if len(values) < k:
-        return sorted(set(values))
-    
-    # Initialize centers with evenly spaced quantiles
-    sorted_vals = sorted(values)
-    centers = []
-    step = len(sorted_vals) / k
-    for i in range(k):
-        idx = int(i * step)
-        if idx >= len(sorted_vals):
-            idx = len(sorted_vals) - 1
-        centers.append(sorted_vals[idx])
-    
-    # Iterate to refine centers
-    for _ in range(iters):
-        # Assign each value to nearest center
-        clusters = [[] for _ in range(k)]
-        for val in values:
-            nearest_idx = min(range(k), key=lambda i: abs(val - centers[i]))
-            clusters[nearest_idx].append(val)
-        
-        # Update centers as mean of assigned values
-        new_centers = []
-        for cluster in clusters:
-            if cluster:
-                new_centers.append(sum(cluster) / len(cluster))
-            else:
-                # Keep old center if cluster is empty
-                new_centers.append(centers[len(new_centers)])
-        
-        centers = new_centers
-    
-    return sorted(centers)
+from collections import Counter
+from functools import cached_property
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Optional
+
+import numpy as np
+
+from app.services.columns import ColumnBands, NearestColumns
+from app.services.kmeans import kmeans_1d, kmeans_1d_exact
+from app.services.operations import ccc_operations
+from app.services.parse_cache import cache_key, layout_cache
+from app.services.tiles import tile_url
+from app.services.word_store import WordStore
+
+# Bump whenever extraction or grid output changes so cached parses are not reused
+PARSER_VERSION = "12"
 
 
 def group_rows(words: List[Dict], y_thresh: float = 8.0) -> List[Dict]:
-    """Group words into rows by y-center proximity."""
+    """
+    Group words into rows by y-center proximity.
+
+    One sweep in y order: a word joins the last row if it is within y_thresh
+    of that row's mean, else starts a new row. Earlier rows can never match
+    again (the word that opened the next row was already too far below them,
+    and later words are lower still), so this gives the same rows as trying
+    every row. The running sum adds members in the same order, so the means
+    are bit-for-bit what averaging the row on each insert produced.
+    """
     rows = []
+    total = 0.0
     for w in sorted(words, key=lambda x: (x["y0"] + x["y1"]) / 2):
         ymid = (w["y0"] + w["y1"]) / 2
-        placed = False
-        for r in rows:
-            if abs(r["ymid"] - ymid) <= y_thresh:
-                r["words"].append(w)
-                r["ymid"] = sum(((ww["y0"] + ww["y1"]) / 2 for ww in r["words"])) / len(r["words"])
-                placed = True
-                break
-        if not placed:
+        if rows and abs(rows[-1]["ymid"] - ymid) <= y_thresh:
+            row = rows[-1]
+            row["words"].append(w)
+            total += ymid
+            row["ymid"] = total / len(row["words"])
+        else:
             rows.append({"ymid": ymid, "words": [w]})
+            total = ymid
     return rows
 
 
 def detect_anchors_and_vehicle_info(
-    pages: List[Dict]
+    index: "RowIndex"
 ) -> Tuple[Optional[int], Optional[float], Optional[int], Optional[float], str, str]:
     """
     Detect anchor points in PDF and extract vehicle information.
@@ -78,27 +59,20 @@ def detect_anchors_and_vehicle_info(
     second_ro_line = ""
     vehicle_info_line = ""
 
-    for pi, page in enumerate(pages, start=1):
-        rows = group_rows(page.get("words", []), y_thresh=6.0)
-        for idx, r in enumerate(rows):
-            row_text = " ".join(w.get("text", "") for w in r["words"]).strip()
-
-            if re.search(r"\bRO\b", row_text):
+    for pi in range(1, index.page_count + 1):
+        rows = index.full(pi)
+        for idx in range(len(rows)):
+            if rows.has_ro(idx):
                 ro_count += 1
                 if ro_count == 2 and not anchor_page:
                     anchor_page = pi
-                    anchor_ymid = r["ymid"]
-                    second_ro_line = row_text
+                    anchor_ymid = rows.ymids[idx]
+                    second_ro_line = rows.texts[idx]
+                    vehicle_info_line = rows.vehicle_line_after(idx)
 
-                    for j in range(idx + 1, min(idx + 10, len(rows))):
-                        next_line = " ".join(w.get("text", "") for w in rows[j]["words"]).strip()
-                        if re.search(r'\b(19\d{2}|20\d{2})\b', next_line):
-                            vehicle_info_line = next_line
-                            break
-
-            if not subtotals_page and re.search(r"\bESTIMATE\s+TOTALS\b", row_text):
+            if not subtotals_page and rows.has_totals(idx):
                 subtotals_page = pi
-                subtotals_ymid = r["ymid"]
+                subtotals_ymid = rows.ymids[idx]
 
         if anchor_page and subtotals_page:
             break
@@ -106,80 +80,187 @@ def detect_anchors_and_vehicle_info(
     return anchor_page, anchor_ymid, subtotals_page, subtotals_ymid, second_ro_line, vehicle_info_line
 
 
-def collect_words_in_range(
-    pages: List[Dict],
-    anchor_page: Optional[int],
-    anchor_ymid: Optional[float],
-    subtotals_page: Optional[int],
-    subtotals_ymid: Optional[float],
-) -> List[Dict]:
-    """Collect all words within the anchor and subtotals vertical range."""
-    all_words = []
-    for pi, page in enumerate(pages, start=1):
-        if anchor_page and pi < anchor_page:
-            continue
-        if subtotals_page and pi > subtotals_page:
-            continue
+def _group_row_indices(store: WordStore, idx: np.ndarray, y_thresh: float = 6.0) -> Tuple[List[List[int]], List[float]]:
+    """group_rows for store indices: same sweep, same rows in the same order. Returns (rows, row means)."""
+    order = idx[np.argsort(store.ymid[idx], kind="stable")].tolist()
+    ys = store.ymid[order].tolist()
 
-        for wd in page.get("words", []):
-            if anchor_page and pi == anchor_page and anchor_ymid is not None:
-                if wd.get("ymid", 0) < (anchor_ymid - 3.0):
-                    continue
-            if subtotals_page and pi == subtotals_page and subtotals_ymid is not None:
-                if wd.get("ymid", 0) > subtotals_ymid:
-                    continue
-            all_words.append(wd)
+    rows = []
+    means = []
+    total = 0.0
+    for pos, ymid in zip(order, ys):
+        if rows and abs(means[-1] - ymid) <= y_thresh:
+            rows[-1].append(pos)
+            total += ymid
+            means[-1] = total / len(rows[-1])
+        else:
+            rows.append([pos])
+            means.append(ymid)
+            total = ymid
+    return rows, means
+
+
+RO_PATTERN = re.compile(r"\bRO\b")
+TOTALS_PATTERN = re.compile(r"\bESTIMATE\s+TOTALS\b")
+YEAR_PATTERN = re.compile(r"\b(19\d{2}|20\d{2})\b")
+LINE_NUMBER_PATTERN = re.compile(r"^\d{1,3}$")
+HEADER_TOKENS = ("LINE", "OPER", "DESCRIPTION", "LABOR", "PAINT")
+# Column keys reported by header detection, left to right
+HEADER_COLUMNS = ("line", "oper", "description", "part_number", "qty", "ext_price", "labor", "paint")
+
+
+class PageRows:
+    """
+    Rows of one page: store indices per row (in y order) and row means.
+    Joined row text and regex hits are computed on first use and kept.
+    """
 
-    return all_words
+    def __init__(self, rows: List[List[int]], ymids: List[float], text_of: List[str]):
+        self.rows = rows
+        self.ymids = ymids
+        self._text_of = text_of
+        self._ro: Optional[List[bool]] = None
+        self._totals: Optional[List[bool]] = None
 
+    @cached_property
+    def texts(self) -> List[str]:
+        return [" ".join(self._text_of[p] for p in row).strip() for row in self.rows]
 
-def detect_header_columns(
-    pages: List[Dict],
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def has_ro(self, i: int) -> bool:
+        if self._ro is None:
+            self._ro = [RO_PATTERN.search(t) is not None for t in self.texts]
+        return self._ro[i]
+
+    def has_totals(self, i: int) -> bool:
+        if self._totals is None:
+            self._totals = [TOTALS_PATTERN.search(t) is not None for t in self.texts]
+        return self._totals[i]
+
+    def is_header(self, i: int) -> bool:
+        upper = self.texts[i].upper()
+        return all(token in upper for token in HEADER_TOKENS)
+
+    def vehicle_line_after(self, i: int) -> str:
+        """First row with a model year within the 9 rows after row i."""
+        for j in range(i + 1, min(i + 10, len(self.rows))):
+            if YEAR_PATTERN.search(self.texts[j]):
+                return self.texts[j]
+        return ""
+
+
+class RowIndex:
+    """
+    Per-page rows for one document, built once and shared by anchor
+    detection, header detection and item extraction. Full-page rows come
+    from the extractor's cached rows when the page has them; only the
+    anchor and totals pages are regrouped for the line-item window.
+    """
+
+    def __init__(self, pages: List[Dict], store: WordStore):
+        self.pages = pages
+        self.store = store
+        self.text_of = store.text.tolist()
+        self._full: Dict[int, PageRows] = {}
+        self._windows: Dict[tuple, List[Tuple[int, PageRows]]] = {}
+
+    @property
+    def page_count(self) -> int:
+        return self.store.page_count
+
+    def full(self, pi: int) -> PageRows:
+        """All rows of page pi (1-based)."""
+        if pi not in self._full:
+            page = self.pages[pi - 1]
+            lo = int(self.store.page_starts[pi - 1])
+            if "row_index" in page:
+                rows = [[lo + i for i in r["words"]] for r in page["row_index"]]
+                ymids = [r["ymid"] for r in page["row_index"]]
+            elif "rows" in page:
+                position = {id(w): lo + i for i, w in enumerate(page["words"])}
+                rows = [[position[id(w)] for w in r["words"]] for r in page["rows"]]
+                ymids = [r["ymid"] for r in page["rows"]]
+            else:
+                idx = np.arange(lo, self.store.page_starts[pi])
+                rows, ymids = _group_row_indices(self.store, idx)
+            self._full[pi] = PageRows(rows, ymids, self.text_of)
+        return self._full[pi]
+
+    def window(
+        self,
+        anchor_page: Optional[int],
+        anchor_ymid: Optional[float],
+        subtotals_page: Optional[int],
+        subtotals_ymid: Optional[float],
+    ) -> List[Tuple[int, PageRows]]:
+        """(page, rows) for every page with words in the line-item window (see _region_mask)."""
+        key = (anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+        if key not in self._windows:
+            mask = _region_mask(self.store, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+            window = []
+            for pi in range(1, self.page_count + 1):
+                idx = self.store.page_indices(pi, mask)
+                if not len(idx):
+                    continue
+                cut = (anchor_page and pi == anchor_page and anchor_ymid is not None) or \
+                      (subtotals_page and pi == subtotals_page and subtotals_ymid is not None)
+                if cut:
+                    # Rows of the cut page can differ from its full rows; regroup what's left
+                    window.append((pi, PageRows(*_group_row_indices(self.store, idx), self.text_of)))
+                else:
+                    window.append((pi, self.full(pi)))
+            self._windows[key] = window
+        return self._windows[key]
+
+
+def _page_range_mask(store: WordStore, anchor_page: Optional[int], subtotals_page: Optional[int]) -> np.ndarray:
+    keep = np.ones(len(store), dtype=bool)
+    if anchor_page:
+        keep &= store.page >= anchor_page
+    if subtotals_page:
+        keep &= store.page <= subtotals_page
+    return keep
+
+
+def _region_mask(
+    store: WordStore,
     anchor_page: Optional[int],
     anchor_ymid: Optional[float],
     subtotals_page: Optional[int],
     subtotals_ymid: Optional[float],
-) -> Dict[str, Optional[float]]:
+) -> np.ndarray:
+    """Words from 3pt above the anchor row down to 3pt above the ESTIMATE TOTALS row."""
+    keep = _page_range_mask(store, anchor_page, subtotals_page)
+    if anchor_page and anchor_ymid is not None:
+        keep &= ~((store.page == anchor_page) & (store.ymid < anchor_ymid - 3.0))
+    if subtotals_page and subtotals_ymid is not None:
+        keep &= ~((store.page == subtotals_page) & (store.ymid >= subtotals_ymid - 3.0))
+    return keep
+
+
+def find_header_columns(
+    index: RowIndex,
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+) -> Optional[Dict[str, Optional[float]]]:
     """
-    Detect column x-positions by finding the header row containing:
-    LINE, OPER, DESCRIPTION, PART, QTY, EXTENDED, LABOR, PAINT.
-    """
-    header_columns = {
-        "line": None,
-        "oper": None,
-        "description": None,
-        "part_number": None,
-        "qty": None,
-        "ext_price": None,
-        "labor": None,
-        "paint": None,
-    }
-
-    for pi, page in enumerate(pages, start=1):
-        if anchor_page and pi < anchor_page:
-            continue
-        if subtotals_page and pi > subtotals_page:
-            continue
-
-        page_words = []
-        for wd in page.get("words", []):
-            if anchor_page and pi == anchor_page and anchor_ymid is not None:
-                if wd.get("ymid", 0) < (anchor_ymid - 3.0):
-                    continue
-            if subtotals_page and pi == subtotals_page and subtotals_ymid is not None:
-                if wd.get("ymid", 0) >= (subtotals_ymid - 3.0):
-                    continue
-            page_words.append(wd)
-
-        rows = group_rows(page_words, y_thresh=6.0)
-
-        for row in rows:
-            row_text_upper = " ".join(w["text"] for w in row["words"]).upper()
+    Column x-positions from the first header row in the window (the row
+    containing LINE, OPER, DESCRIPTION, PART, QTY, EXTENDED, LABOR, PAINT),
+    or None if there is no header row.
+    """
+    header_columns = dict.fromkeys(HEADER_COLUMNS)
 
-            if all(token in row_text_upper for token in ["LINE", "OPER", "DESCRIPTION", "LABOR", "PAINT"]):
-                for wd in row["words"]:
-                    txt = wd["text"].upper()
-                    xmid = wd["xmid"]
+    store = index.store
+    for pi, rows in index.window(anchor_page, anchor_ymid, subtotals_page, subtotals_ymid):
+        for i, row in enumerate(rows.rows):
+            if rows.is_header(i):
+                texts = [index.text_of[p] for p in row]
+                for txt, xmid in zip(texts, store.xmid[row].tolist()):
+                    txt = txt.upper()
 
                     if "LINE" in txt and header_columns["line"] is None:
                         header_columns["line"] = xmid
@@ -200,9 +281,208 @@ def detect_header_columns(
 
                 return header_columns
 
+    return None
+
+
+def detect_header_columns(
+    index: RowIndex,
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+) -> Dict[str, Optional[float]]:
+    """
+    Detect column x-positions from the header row (see find_header_columns).
+    Falls back to infer_value_columns when there is no header row.
+    """
+    header_columns = find_header_columns(index, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+    if header_columns is not None:
+        return header_columns
+    return _inferred_header_columns(index, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+
+
+def _inferred_header_columns(
+    index: RowIndex,
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+) -> Dict[str, Optional[float]]:
+    # No header row in the window (cut off, or not extracted): infer the columns
+    header_columns = dict.fromkeys(HEADER_COLUMNS)
+    header_columns.update(infer_value_columns(index, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid))
     return header_columns
 
 
+def infer_value_columns(
+    index: RowIndex,
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+    col_tol: float = 25.0,
+) -> Dict[str, float]:
+    """
+    Header-less fallback: cluster the x-midpoints of the numeric (or 'Incl')
+    cells in the window with exact 1D k-means. The leftmost column is LINE and
+    the rightmost four are QTY, EXTENDED, LABOR and PAINT; clusters in between
+    (operation codes, numbers inside descriptions or part numbers) are ignored.
+    Returns {} when fewer than five distinct columns are found.
+    """
+    store = index.store
+    mask = _region_mask(store, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+    xmids = [
+        x
+        for x, t in zip(store.xmid[mask].tolist(), store.text[mask].tolist())
+        if _parse_numeric_or_incl(t) is not None
+    ]
+
+    # One cluster per header column; surplus clusters split a column into
+    # nearby centers, which are folded back together here
+    columns: List[float] = []
+    for center in kmeans_1d_exact(xmids, 8):
+        if not columns or center - columns[-1] >= col_tol:
+            columns.append(center)
+    if len(columns) < 5:
+        return {}
+
+    return {
+        "line": columns[0],
+        "qty": columns[-4],
+        "ext_price": columns[-3],
+        "labor": columns[-2],
+        "paint": columns[-1],
+    }
+
+
+# ---------------------------------------------------------
+# LAYOUT TEMPLATES
+# ---------------------------------------------------------
+
+# Item rows a cached layout is checked against before it is trusted
+TEMPLATE_CHECK_ROWS = 20
+
+
+def layout_fingerprint(page: Dict) -> Optional[str]:
+    """
+    Page size, font set and header row token positions of a page (extractor
+    pages carry "fonts" and "header"). Pages of one estimating system and
+    version share it. None for pages without a header row in their text
+    layer (scans included): nothing there tells one layout from another.
+    """
+    fonts = page.get("fonts")
+    header = page.get("header")
+    if not fonts or not header:
+        return None
+    layout = repr((round(page["width"]), round(page["height"]), tuple(fonts), tuple(header)))
+    return hashlib.sha1(layout.encode()).hexdigest()
+
+
+def template_fits(
+    index: RowIndex,
+    columns: Dict[str, Optional[float]],
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+    col_tol: float = 25.0,
+) -> bool:
+    """
+    Check cached columns against the first item rows of the window (rows
+    starting with a line number): the line number must sit in the LINE band,
+    every numeric cell right of the description in the QTY, EXTENDED, LABOR
+    or PAINT band, and every numeric cell in the LABOR or PAINT band must
+    read as hours (prices there mean the columns are off). At least one item
+    row is needed, and the columns must be in the order the header prints them.
+    """
+    positions = [columns.get(col) for col in ("line", "qty", "ext_price", "labor", "paint")]
+    # Values alone can't tell LABOR from PAINT; the columns must at least be in printed order
+    if any(x is None for x in positions) or positions != sorted(positions):
+        return False
+
+    line, value_columns = positions[0], positions[1:]
+    hour_columns = positions[3:]
+    value_start = columns["qty"] - col_tol
+    text_of = index.text_of
+    checked = 0
+
+    # A handful of rows, so plain scalar checks beat building column masks
+    for pi, rows in index.window(anchor_page, anchor_ymid, subtotals_page, subtotals_ymid):
+        for row in rows.rows:
+            xs = index.store.xmid[row].tolist()
+            first = min(range(len(row)), key=xs.__getitem__)
+            if not LINE_NUMBER_PATTERN.match(text_of[row[first]].strip()):
+                continue
+
+            if abs(xs[first] - line) >= col_tol:
+                return False
+            for p, x in zip(row, xs):
+                if x <= value_start:
+                    continue
+                value = _parse_numeric_or_incl(text_of[p])
+                if value is None:
+                    continue
+                if all(abs(x - c) >= col_tol for c in value_columns):
+                    return False
+                if any(abs(x - c) < col_tol for c in hour_columns) and not -99.9 <= value <= 99.9:
+                    return False
+
+            checked += 1
+            if checked == TEMPLATE_CHECK_ROWS:
+                return True
+
+    return checked > 0
+
+
+def cached_layout(
+    index: RowIndex,
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+    fingerprint: Optional[str],
+) -> Optional[Dict[str, Optional[float]]]:
+    """The learned columns for this layout fingerprint, if there are any and they fit the window."""
+    if not fingerprint:
+        return None
+    template = layout_cache.get(cache_key(fingerprint, PARSER_VERSION))
+    if template is None or not template_fits(index, template, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid):
+        return None
+    return dict(template)
+
+
+def learn_layout(fingerprint: Optional[str], columns: Dict[str, Optional[float]]):
+    """Remember columns read from a header row for the next document with this layout."""
+    if fingerprint:
+        layout_cache.put(cache_key(fingerprint, PARSER_VERSION), columns)
+
+
+def resolve_columns(
+    index: RowIndex,
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+    fingerprint: Optional[str] = None,
+) -> Dict[str, Optional[float]]:
+    """
+    detect_header_columns with a layout template between the header row and
+    inference: a header row in the window always wins (and is learned for the
+    next document with this fingerprint); without one, a cached layout that
+    fits the first item rows is used before the columns are inferred.
+    """
+    bounds = (anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+    columns = find_header_columns(index, *bounds)
+    if columns is not None:
+        learn_layout(fingerprint, columns)
+        return columns
+
+    columns = cached_layout(index, *bounds, fingerprint)
+    if columns is not None:
+        return columns
+    return _inferred_header_columns(index, *bounds)
+
+
 def _parse_numeric_or_incl(text: str) -> Optional[float]:
     """Parse numeric or 'Incl'. Returns float or None."""
     t = text.strip()
@@ -218,119 +498,188 @@ def _parse_numeric_or_incl(text: str) -> Optional[float]:
     return None
 
 
-def extract_labor_paint_items(
-    pages: List[Dict],
+def _hour_value(text: str) -> Optional[float]:
+    """A labor/paint cell: nonzero hours within +/-99.9, else None."""
+    parsed = _parse_numeric_or_incl(text)
+    if parsed is not None and parsed != 0.0 and -99.9 <= parsed <= 99.9:
+        return parsed
+    return None
+
+
+def _row_box(store: WordStore, row: List[int]) -> Tuple[float, float, float, float]:
+    """Bounding box (x0, y0, x1, y1) of a row's words."""
+    idx = np.asarray(row, dtype=np.int64)
+    return (
+        float(store.x0[idx].min()),
+        float(store.y0[idx].min()),
+        float(store.x1[idx].max()),
+        float(store.y1[idx].max()),
+    )
+
+
+def iter_window_items(
+    index: RowIndex,
     columns: Dict[str, Optional[float]],
     anchor_page: Optional[int],
     anchor_ymid: Optional[float],
     subtotals_page: Optional[int],
     subtotals_ymid: Optional[float],
-) -> Tuple[List[Dict], List[Dict]]:
+    counts: Optional[Counter] = None,
+) -> Iterator[Tuple[int, str, Dict, Tuple[float, float, float, float]]]:
     """
-    Extract labor and paint items using CCC rules.
+    Labor and paint items using CCC rules, row by row through the window:
+    (page, "labor" or "paint", item, bounding box of the item's row in PDF points).
+    Items carry the row's operation code. Rows matched per operation rule
+    are added to counts when given.
     """
-    labor_items = []
-    paint_items = []
-
     col_tol = 25.0
+    store = index.store
+    xmid = store.xmid
+
+    # Description from LINE to QTY to capture full text
+    description = None
+    if columns["line"] is not None and columns["qty"] is not None:
+        description = (columns["line"] + col_tol, columns["qty"] - col_tol)
+    bands = ColumnBands.around(
+        {"line": columns["line"], "labor": columns["labor"], "paint": columns["paint"]},
+        col_tol,
+        {"description": description},
+    )
 
-    for pi, page in enumerate(pages, start=1):
-        if anchor_page and pi < anchor_page:
-            continue
-        if subtotals_page and pi > subtotals_page:
-            continue
+    # Column membership for every word at once
+    member = bands.members(xmid)
+    near_line = member["line"]
+    near_labor = member["labor"]
+    near_paint = member["paint"]
+    in_description = member["description"]
 
-        page_words = []
-        for wd in page.get("words", []):
-            if anchor_page and pi == anchor_page and anchor_ymid is not None:
-                if wd["ymid"] < (anchor_ymid - 3.0):
-                    continue
-            if subtotals_page and pi == subtotals_page and subtotals_ymid is not None:
-                if wd["ymid"] >= (subtotals_ymid - 3.0):
-                    continue
-            page_words.append(wd)
+    # Words outside every column can't affect an item
+    relevant = (near_line | near_labor | near_paint | in_description).tolist()
+
+    # Plain lists for the per-row loop; indexing NumPy arrays word by word is slower
+    xmid_of = xmid.tolist()
+    text_of = index.text_of
+    near_line = near_line.tolist()
+    near_labor = near_labor.tolist()
+    near_paint = near_paint.tolist()
+    in_description = in_description.tolist()
 
-        rows = group_rows(page_words, y_thresh=6.0)
+    # Cell values repeat a lot ("1.0", "Incl."); parse each distinct text once
+    hours: Dict[str, Optional[float]] = {}
 
-        for row in rows:
-            row_words = sorted(row["words"], key=lambda x: x["xmid"])
+    for pi, rows in index.window(anchor_page, anchor_ymid, subtotals_page, subtotals_ymid):
+        for full_row in rows.rows:
+            # Rows are shared with the other stages, so this is a filtered, sorted copy
+            row = sorted((p for p in full_row if relevant[p]), key=xmid_of.__getitem__)
 
             line_num = None
             labor_val = None
             paint_val = None
             description_parts = []
 
-            for wd in row_words:
-                word_xmid = wd["xmid"]
-                word_text = wd["text"].strip()
+            for p in row:
+                word_text = text_of[p].strip()
 
                 # Line number
-                if columns["line"] is not None and abs(word_xmid - columns["line"]) < col_tol:
-                    if re.match(r'^\d{1,3}$', word_text):
-                        line_num = word_text
+                if near_line[p] and LINE_NUMBER_PATTERN.match(word_text):
+                    line_num = word_text
 
-                # Description from LINE to QTY to capture full text
-                if columns["line"] is not None and columns["qty"] is not None:
-                    if columns["line"] + col_tol < word_xmid < columns["qty"] - col_tol:
-                        description_parts.append(word_text)
+                if in_description[p]:
+                    description_parts.append(word_text)
 
                 # Labor
-                if columns["labor"] is not None and abs(word_xmid - columns["labor"]) < col_tol:
-                    parsed = _parse_numeric_or_incl(word_text)
-                    if parsed is not None and parsed != 0.0 and -99.9 <= parsed <= 99.9:
-                        labor_val = parsed
+                if near_labor[p]:
+                    if word_text not in hours:
+                        hours[word_text] = _hour_value(word_text)
+                    if hours[word_text] is not None:
+                        labor_val = hours[word_text]
 
                 # Paint
-                if columns["paint"] is not None and abs(word_xmid - columns["paint"]) < col_tol:
-                    parsed = _parse_numeric_or_incl(word_text)
-                    if parsed is not None and parsed != 0.0 and -99.9 <= parsed <= 99.9:
-                        paint_val = parsed
+                if near_paint[p]:
+                    if word_text not in hours:
+                        hours[word_text] = _hour_value(word_text)
+                    if hours[word_text] is not None:
+                        paint_val = hours[word_text]
 
             desc_text = " ".join(description_parts).strip()
-            desc_lower = desc_text.lower()
-
-            # Clear coat lines are paint-only, exclude from labor
-            is_clear_coat = "add for clear coat" in desc_lower
-
-            # Labor override for REPL or R&I
-            is_repl_or_ri = ("repl" in desc_lower) or ("r&i" in desc_lower)
-
-            if line_num and (labor_val is not None or is_repl_or_ri) and not is_clear_coat:
-                labor_items.append({
+            # REPL/R&I lines are labor even without hours; clear coat lines are paint-only
+            row_class = ccc_operations.classify(desc_text)
+            if counts is not None:
+                counts.update(row_class.rules)
+
+            is_labor = line_num and (labor_val is not None or row_class.force_labor) and not row_class.no_labor
+            is_paint = line_num and paint_val is not None
+            if not (is_labor or is_paint):
+                continue
+            box = _row_box(store, full_row)
+
+            if is_labor:
+                yield pi, "labor", {
                     "line": line_num,
                     "description": desc_text,
                     "value": labor_val if labor_val is not None else 0.0,
-                })
+                    "operation": row_class.operation,
+                }, box
 
-            if line_num and paint_val is not None:
-                paint_items.append({
+            if is_paint:
+                yield pi, "paint", {
                     "line": line_num,
                     "description": desc_text,
                     "value": paint_val,
-                })
-
-    return labor_items, paint_items
+                    "operation": row_class.operation,
+                }, box
 
 
-def process_pdf_grid(pages: List[Dict]) -> Dict[str, Any]:
-    """Main entry point."""
-    for pi, page in enumerate(pages, start=1):
-        for w in page.get("words", []):
-            w["page_index"] = pi
-            w["xmid"] = (w["x0"] + w["x1"]) / 2.0
-            w["ymid"] = (w["y0"] + w["y1"]) / 2.0
+def describe_anchor_row(index: RowIndex, anchor_page: Optional[int], anchor_ymid: Optional[float]) -> Tuple[str, str]:
+    """
+    Text of the anchor (second RO) row and the vehicle line after it, for
+    pages whose anchor was located up front (see extractor.extract_line_item_pages).
+    """
+    if not anchor_page or anchor_page > index.page_count:
+        return "", ""
 
-    anchor_page, anchor_ymid, subtotals_page, subtotals_ymid, second_ro_line, vehicle_info_line = \
-        detect_anchors_and_vehicle_info(pages)
+    rows = index.full(anchor_page)
+    if not len(rows):
+        return "", ""
 
-    all_words = collect_words_in_range(pages, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+    idx = min(range(len(rows)), key=lambda i: abs(rows.ymids[i] - anchor_ymid))
+    return rows.texts[idx], rows.vehicle_line_after(idx)
 
-    columns = detect_header_columns(pages, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
 
-    labor_items, paint_items = extract_labor_paint_items(
-        pages, columns, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid
+def process_pdf_grid(pages: List[Dict], region: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Main entry point. Pass region (anchor/subtotals fields) when the extractor
+    already located the line-item region, so anchor detection is skipped.
+    Rows are grouped once per page and shared by every stage.
+    """
+    index = RowIndex(pages, WordStore.from_pages(pages))
+
+    if region is None:
+        anchor_page, anchor_ymid, subtotals_page, subtotals_ymid, second_ro_line, vehicle_info_line = \
+            detect_anchors_and_vehicle_info(index)
+    else:
+        anchor_page = region["anchor_page"]
+        anchor_ymid = region["anchor_ymid"]
+        subtotals_page = region["subtotals_page"]
+        subtotals_ymid = region["subtotals_ymid"]
+        second_ro_line, vehicle_info_line = describe_anchor_row(index, anchor_page, anchor_ymid)
+
+    # The layout is taken from the first page of the line-item window
+    first_page = pages[anchor_page - 1] if anchor_page and anchor_page <= len(pages) else (pages[0] if pages else {})
+    columns = resolve_columns(
+        index, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid, layout_fingerprint(first_page)
     )
 
+    labor_items = []
+    paint_items = []
+    # Where each item was printed, for the page overlays
+    item_rows = []
+    operation_counts = Counter()
+    bounds = (anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+    for pi, kind, item, box in iter_window_items(index, columns, *bounds, operation_counts):
+        (labor_items if kind == "labor" else paint_items).append(item)
+        item_rows.append({"page": pi, "kind": kind, "line": item["line"], "value": item["value"], "bbox": box})
+
     total_labor = sum(item["value"] for item in labor_items)
     total_paint = sum(item["value"] for item in paint_items)
 
@@ -345,19 +694,106 @@ def process_pdf_grid(pages: List[Dict]) -> Dict[str, Any]:
         "anchor_ymid": anchor_ymid,
         "subtotals_page": subtotals_page,
         "subtotals_ymid": subtotals_ymid,
+        "item_rows": item_rows,
+        "operation_counts": dict(operation_counts),
     }
 
 
-def generate_pages_html(
+def _page_window(
+    pi: int,
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+) -> Optional[Tuple]:
+    """Window arguments for page pi indexed on its own (as page 1), or None if it is outside the window."""
+    if (anchor_page and pi < anchor_page) or (subtotals_page and pi > subtotals_page):
+        return None
+    return (
+        1 if pi == anchor_page else None,
+        anchor_ymid if pi == anchor_page else None,
+        1 if pi == subtotals_page else None,
+        subtotals_ymid if pi == subtotals_page else None,
+    )
+
+
+def iter_line_items(pages: Iterable[Dict], region: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Labor and paint items page by page while pages are still being read:
+    {"kind": "labor" | "paint", "page", "line", "description", "value"}.
+    Pages are held back only until the header row turns up; a document
+    without one gets a learned layout or is clustered once every page is in
+    (see resolve_columns).
+    Per kind, the items and their order match process_pdf_grid.
+
+    region may still be filling in while pages arrive (see
+    extractor.iter_line_item_pages); each page is placed with the region as
+    it stands when that page arrives. Without a region the anchors are
+    searched on the whole document first, so pages is read up front.
+    """
+    if region is None:
+        pages = list(pages)
+        index = RowIndex(pages, WordStore.from_pages(pages))
+        region = dict(zip(
+            ("anchor_page", "anchor_ymid", "subtotals_page", "subtotals_ymid"),
+            detect_anchors_and_vehicle_info(index)[:4],
+        ))
+
+    def bounds() -> Tuple:
+        return region["anchor_page"], region["anchor_ymid"], region["subtotals_page"], region["subtotals_ymid"]
+
+    columns = None
+    fingerprint = None
+    read: List[Dict] = []
+    pending: List[Tuple[int, RowIndex, Tuple]] = []
+
+    for pi, page in enumerate(pages, start=1):
+        window = _page_window(pi, *bounds())
+        if columns is None:
+            read.append(page)
+        if window is None:
+            continue
+
+        # Each page gets its own index, so items can go out before later pages exist
+        local = RowIndex([page], WordStore.from_pages([page]))
+        pending.append((pi, local, window))
+        if columns is None:
+            if len(pending) == 1:
+                # The layout is taken from the first page of the window
+                fingerprint = layout_fingerprint(page)
+            columns = find_header_columns(local, *window)
+            if columns is None:
+                continue
+            learn_layout(fingerprint, columns)
+
+        for page_no, local, window in pending:
+            for _, kind, item, _ in iter_window_items(local, columns, *window):
+                yield {"kind": kind, "page": page_no, **item}
+        pending = []
+        read = []
+
+    if columns is None and read:
+        # No header row anywhere: a learned layout, else columns inferred from the whole window
+        index = RowIndex(read, WordStore.from_pages(read))
+        columns = cached_layout(index, *bounds(), fingerprint) or _inferred_header_columns(index, *bounds())
+        for page_no, kind, item, _ in iter_window_items(index, columns, *bounds()):
+            yield {"kind": kind, "page": page_no, **item}
+
+
+def page_fragments(
     pages: List[Dict],
     anchor_page: Optional[int],
     anchor_ymid: Optional[float],
     subtotals_page: Optional[int],
     subtotals_ymid: Optional[float],
     display_w: int = 1200,
-) -> str:
-    """Generate HTML visualization."""
-    pages_html = ""
+) -> List[Dict]:
+    """
+    Visualization of each page in the line-item window, rendered separately
+    so the grid view can load pages as they scroll into view:
+    {"page", "width", "height", "html"}, html being the page's word boxes.
+    """
+    fragments = []
 
     for pi, page in enumerate(pages, start=1):
         if anchor_page and pi < anchor_page:
@@ -369,33 +805,186 @@ def generate_pages_html(
         h = page.get("height", 1)
         scale = display_w / w if w else 1.0
 
-        boxes_html = ""
-        page_words = []
-
+        boxes = []
         for wd in page.get("words", []):
+            ymid = (wd["y0"] + wd["y1"]) / 2.0
             if anchor_page and pi == anchor_page and anchor_ymid is not None:
-                if wd["ymid"] < (anchor_ymid - 3.0):
+                if ymid < (anchor_ymid - 3.0):
                     continue
             if subtotals_page and pi == subtotals_page and subtotals_ymid is not None:
-                if wd["ymid"] >= (subtotals_ymid - 3.0):
+                if ymid >= (subtotals_ymid - 3.0):
                     continue
-            page_words.append(wd)
 
-        for wd in page_words:
             x = wd["x0"] * scale
             y = wd["y0"] * scale
             ww = (wd["x1"] - wd["x0"]) * scale
             hh = (wd["y1"] - wd["y0"]) * scale
             txt = wd["text"].replace("<", "&lt;").replace(">", "&gt;")
-            boxes_html += (
+            boxes.append(
                 f"<div style='position:absolute; left:{x}px; top:{y}px; "
                 f"width:{ww}px; height:{hh}px; font-size:15px; overflow:hidden;'>{txt}</div>"
             )
 
-        pages_html += (
-            f"<h3>Page {pi}</h3>"
-            f"<div style='position:relative; width:{display_w}px; height:{int(h*scale)}px; "
-            f"border:1px solid #ccc; margin-bottom:20px;'>{boxes_html}</div>"
-        )
+        fragments.append({"page": pi, "width": display_w, "height": int(h * scale), "html": "".join(boxes)})
+
+    return fragments
+
+
+# Outline and fill of the rows picked as labor/paint lines on a page tile
+ITEM_ROW_COLORS = {"labor": (0, 102, 204), "paint": (214, 110, 0)}
+
+
+def tile_fragments(
+    pages: List[Dict],
+    anchor_page: Optional[int],
+    subtotals_page: Optional[int],
+    item_rows: List[Dict],
+    tiles: Dict[int, str],
+    doc_key: str,
+    display_w: int = 1200,
+) -> List[Dict]:
+    """
+    Like page_fragments, but each page is its rendered image (tiles maps
+    page number to tile key, see tiles.tile_url) with only the labor/paint
+    rows outlined on top (item_rows from process_pdf_grid). Fragments also
+    carry their "tile" key.
+    """
+    rows_by_page: Dict[int, List[Dict]] = {}
+    for row in item_rows:
+        rows_by_page.setdefault(row["page"], []).append(row)
+
+    fragments = []
+    for pi, page in enumerate(pages, start=1):
+        if anchor_page and pi < anchor_page:
+            continue
+        if subtotals_page and pi > subtotals_page:
+            continue
+
+        w = page.get("width", 1)
+        h = page.get("height", 1)
+        scale = display_w / w if w else 1.0
+        height = int(h * scale)
+
+        parts = [
+            f"<img src='{tile_url(tiles[pi], doc_key, pi)}' width='{display_w}' height='{height}' alt='Page {pi}' "
+            f"loading='lazy' style='position:absolute; left:0; top:0;'>"
+        ]
+        for row in rows_by_page.get(pi, []):
+            x0, y0, x1, y1 = row["bbox"]
+            r, g, b = ITEM_ROW_COLORS[row["kind"]]
+            parts.append(
+                f"<div title='Line {row['line']} {row['kind']} {row['value']}' "
+                f"style='position:absolute; left:{x0 * scale - 2:.1f}px; top:{y0 * scale - 2:.1f}px; "
+                f"width:{(x1 - x0) * scale + 4:.1f}px; height:{(y1 - y0) * scale + 4:.1f}px; "
+                f"border:2px solid rgba({r},{g},{b},0.85); background:rgba({r},{g},{b},0.12); "
+                f"box-sizing:border-box;'></div>"
+            )
+
+        fragments.append({"page": pi, "width": display_w, "height": height, "html": "".join(parts), "tile": tiles[pi]})
+
+    return fragments
+
+
+def page_frame(fragment: Dict, inner: str = "", attrs: str = "") -> str:
+    """Heading and sized page box for one fragment, with inner as its content."""
+    return (
+        f"<h3>Page {fragment['page']}</h3>"
+        f"<div{attrs} style='position:relative; width:{fragment['width']}px; height:{fragment['height']}px; "
+        f"border:1px solid #ccc; margin-bottom:20px;'>{inner}</div>"
+    )
+
+
+# ---------------------------------------------------------
+# ALIGNED TABLE
+# ---------------------------------------------------------
+
+ALIGNED_COLUMNS = ("Line", "Op", "Description", "Labor", "Paint")
+
+# Rows without a line number that mention one of these are header/customer rows
+ALIGNED_SKIP_WORDS = ("customer", "address", "vin", "page", "estimate", "phone", "fax", "ro")
+ALIGNED_SKIP_LABELS = ("line", "line#", "no", "qty")
+
+
+def _aligned_center_mask(
+    store: WordStore,
+    anchor_page: Optional[int],
+    anchor_ymid: Optional[float],
+    subtotals_page: Optional[int],
+    subtotals_ymid: Optional[float],
+) -> np.ndarray:
+    """Words the aligned columns are clustered from: anchor row through the totals row, or everything."""
+    if not anchor_page:
+        return np.ones(len(store), dtype=bool)
+    on_anchor = (store.page == anchor_page) & (store.ymid >= anchor_ymid)
+    if not subtotals_page:
+        return (store.page > anchor_page) | on_anchor
+    between = (store.page > anchor_page) & (store.page < subtotals_page)
+    on_totals = (store.page == subtotals_page) & (store.ymid <= subtotals_ymid)
+    return between | on_anchor | on_totals
+
+
+def aligned_rows_by_page(pages: List[Dict], region: Optional[Dict] = None) -> Optional[Iterator[Tuple[int, List[List[str]]]]]:
+    """
+    Cluster line-item words into five columns (Line, Op, Description, Labor, Paint).
+    The columns are computed up front from the whole line-item window; the
+    rows are then produced lazily, one (page, rows) pair per page, each row a
+    list of column texts. Returns None if there are no words or the columns
+    can't be computed. Pass region when the extractor already located the
+    line-item window.
+    """
+    store = WordStore.from_pages(pages)
+    if not len(store):
+        return None
+    index = RowIndex(pages, store)
+
+    if region is None:
+        anchor_page, anchor_ymid, subtotals_page, subtotals_ymid = detect_anchors_and_vehicle_info(index)[:4]
+    else:
+        anchor_page = region["anchor_page"]
+        anchor_ymid = region["anchor_ymid"]
+        subtotals_page = region["subtotals_page"]
+        subtotals_ymid = region["subtotals_ymid"]
+
+    mask = _aligned_center_mask(store, anchor_page, anchor_ymid, subtotals_page, subtotals_ymid)
+    centers = kmeans_1d(store.xmid[mask].tolist(), 5, iters=40)
+    if not centers:
+        return None
+
+    nearest = NearestColumns(centers)
+    # Column of every word, looked up once for the document
+    column_of = nearest.assign(store.xmid)
+    xmid_of = store.xmid.tolist()
+    text_of = index.text_of
+
+    def rows_by_page() -> Iterator[Tuple[int, List[List[str]]]]:
+        for pi in range(1, (subtotals_page or index.page_count) + 1):
+            rows = index.full(pi)
+            table_rows = []
+            for ymid, row in zip(rows.ymids, rows.rows):
+                # skip rows above anchor (RO) or at/below subtotals
+                if anchor_page and pi == anchor_page and anchor_ymid is not None and ymid < anchor_ymid:
+                    continue
+                if subtotals_page and pi == subtotals_page and subtotals_ymid is not None and ymid >= subtotals_ymid:
+                    continue
+
+                cols = [[] for _ in range(len(nearest))]
+                for p in sorted(row, key=xmid_of.__getitem__):
+                    cols[column_of[p]].append(text_of[p])
+                vals = [" ".join(texts) for texts in cols]
+
+                # Filter out header/customer rows: require a leading line number in first column
+                left_col = vals[0].strip() if vals else ""
+                if not re.search(r"\b\d+\b", left_col):
+                    combined_text = " ".join(vals).lower()
+                    if any(k in combined_text for k in ALIGNED_SKIP_WORDS):
+                        continue
+                    if left_col.lower() in ALIGNED_SKIP_LABELS:
+                        continue
+
+                # keep only the five columns
+                table_rows.append([(vals[i] if i < len(vals) else "") for i in range(len(ALIGNED_COLUMNS))])
+            if table_rows:
+                yield pi, table_rows
+
+    return rows_by_page()
 
-    return pages_html
\ No newline at end of file
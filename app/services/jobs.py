@@ -0,0 +1,101 @@
+"""Asynchronous parse job records.
+
+Jobs are JSON files in the shared cache directory, so any gunicorn worker can
+answer status and event-stream requests for a job another worker is running,
+and parse workers can report page progress directly.
+"""
+
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from app.services.parse_cache import CACHE_DIR
+
+JOB_DIR = os.path.join(CACHE_DIR, "jobs")
+JOB_TTL_SECONDS = int(os.getenv("FLAGTECH_JOB_TTL", "3600"))
+
+
+def _path(job_id: str) -> str:
+    return os.path.join(JOB_DIR, f"{job_id}.json")
+
+
+def _write(job: Dict[str, Any]):
+    os.makedirs(JOB_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=JOB_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, _path(job["id"]))
+
+
+def _expired(job: Dict[str, Any]) -> bool:
+    return time.time() - job["created"] > JOB_TTL_SECONDS
+
+
+def purge_expired():
+    """Delete job records older than the TTL."""
+    try:
+        names = os.listdir(JOB_DIR)
+    except OSError:
+        return
+    cutoff = time.time() - JOB_TTL_SECONDS
+    for name in names:
+        path = os.path.join(JOB_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def create_job(filename: str = "") -> str:
+    """Record a new queued job and return its id."""
+    purge_expired()
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    _write({
+        "id": job_id,
+        "filename": filename,
+        "status": "queued",
+        "created": now,
+        "updated": now,
+        "progress": {"page": 0, "pages": 0},
+        "result": None,
+        "error": None,
+    })
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """The job record, or None if unknown or past its TTL."""
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_path(job_id)) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if _expired(job):
+        try:
+            os.unlink(_path(job_id))
+        except OSError:
+            pass
+        return None
+    return job
+
+
+def update_job(job_id: str, **fields):
+    """Merge fields into the job record."""
+    job = get_job(job_id)
+    if job is None:
+        return
+    job.update(fields)
+    job["updated"] = time.time()
+    _write(job)
+
+
+def record_progress(job_id: str, page: int, pages: int):
+    """Page progress, written by the parse worker as each page is extracted."""
+    update_job(job_id, status="running", progress={"page": page, "pages": pages})
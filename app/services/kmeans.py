@@ -0,0 +1,132 @@
+"""1D k-means for column discovery.
+
+Two engines over the same input (word x-midpoints):
+
+- kmeans_1d: Lloyd's iterations, vectorized, stopping once the centers no
+  longer move. Same results as the original pure-Python loop.
+- kmeans_1d_exact: the optimal clustering (minimum within-cluster sum of
+  squares), by dynamic programming over the sorted values. No
+  initialization to get wrong, so it is the better choice when there is no
+  header row to anchor the columns.
+"""
+
+from typing import List, Sequence
+
+import numpy as np
+
+
+def kmeans_1d(values: Sequence[float], k: int, iters: int = 40) -> List[float]:
+    """
+    Simple 1D k-means clustering to find k cluster centers.
+    Returns sorted list of k centers.
+    """
+    if len(values) == 0 or k <= 0:
+        return []
+
+    if len(values) < k:
+        return sorted(set(values))
+
+    x = np.asarray(values, dtype=np.float64)
+
+    # Initialize centers with evenly spaced quantiles
+    sorted_vals = np.sort(x, kind="stable")
+    step = len(sorted_vals) / k
+    idx = np.minimum([int(i * step) for i in range(k)], len(sorted_vals) - 1)
+    centers = sorted_vals[idx]
+
+    for _ in range(iters):
+        # Nearest center per value; ties go to the lower index, as min() did
+        labels = np.argmin(np.abs(x[:, None] - centers[None, :]), axis=1)
+
+        # Means of assigned values; bincount sums in input order like sum() did
+        counts = np.bincount(labels, minlength=k)
+        sums = np.bincount(labels, weights=x, minlength=k)
+        # Keep old center if cluster is empty
+        new_centers = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+
+        if np.array_equal(new_centers, centers):
+            # Fixed point: every further iteration would return the same centers
+            break
+        centers = new_centers
+
+    return sorted(centers.tolist())
+
+
+def kmeans_1d_exact(values: Sequence[float], k: int) -> List[float]:
+    """
+    Optimal 1D k-means: the k centers minimizing the within-cluster sum of
+    squares. Clusters of sorted values are contiguous, so this is a DP over
+    split points; the best split moves monotonically with the right end,
+    which lets each of the k layers be solved by divide and conquer in
+    O(n log n). Returns sorted centers (fewer than k if there are fewer
+    distinct values).
+    """
+    if len(values) == 0 or k <= 0:
+        return []
+
+    # Duplicate x positions are common (aligned columns); weight them instead
+    uniq, weights = np.unique(np.asarray(values, dtype=np.float64), return_counts=True)
+    n = len(uniq)
+    if n <= k:
+        return uniq.tolist()
+
+    # Center the values so the prefix sums of squares don't lose precision
+    shift = uniq.mean()
+    x = uniq - shift
+    w = weights.astype(np.float64)
+    cw = np.concatenate(([0.0], np.cumsum(w)))
+    s1 = np.concatenate(([0.0], np.cumsum(w * x)))
+    s2 = np.concatenate(([0.0], np.cumsum(w * x * x)))
+
+    def sse(i, j):
+        """Cost of one cluster holding x[i..j] (i may be an array)."""
+        total = s1[j + 1] - s1[i]
+        return (s2[j + 1] - s2[i]) - total * total / (cw[j + 1] - cw[i])
+
+    # cost[j]: best cost of x[0..j] split into m + 1 clusters; start[m][j]: where the last one starts
+    cost = sse(np.zeros(n, dtype=np.int64), np.arange(n))
+    start = np.zeros((k, n), dtype=np.int64)
+
+    for m in range(1, k):
+        new_cost = np.full(n, np.inf)
+        # Pending subproblems, one per entry: solve right ends j_lo..j_hi
+        # knowing the best split lies in i_lo..i_hi. Each round handles a
+        # whole level of the divide and conquer at once.
+        j_lo = np.array([m])
+        j_hi = np.array([n - 1])
+        i_lo = np.array([m])
+        i_hi = np.array([n - 1])
+        while len(j_lo):
+            j = (j_lo + j_hi) // 2
+            lengths = np.minimum(i_hi, j) - i_lo + 1
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            candidates = np.repeat(i_lo - offsets, lengths) + np.arange(lengths.sum())
+            totals = cost[candidates - 1] + sse(candidates, np.repeat(j, lengths))
+
+            # First minimum of each subproblem's candidates, as argmin would pick
+            minima = np.minimum.reduceat(totals, offsets)
+            hits = np.flatnonzero(totals == np.repeat(minima, lengths))
+            owner = np.repeat(np.arange(len(j)), lengths)[hits]
+            first = hits[np.unique(owner, return_index=True)[1]]
+            split = candidates[first]
+
+            new_cost[j] = totals[first]
+            start[m, j] = split
+
+            left = j_lo <= j - 1
+            right = j + 1 <= j_hi
+            j_lo, j_hi, i_lo, i_hi = (
+                np.concatenate((j_lo[left], (j + 1)[right])),
+                np.concatenate(((j - 1)[left], j_hi[right])),
+                np.concatenate((i_lo[left], split[right])),
+                np.concatenate((split[left], i_hi[right])),
+            )
+        cost = new_cost
+
+    centers = []
+    j = n - 1
+    for m in range(k - 1, -1, -1):
+        i = int(start[m, j]) if m else 0
+        centers.append(float(np.average(uniq[i:j + 1], weights=w[i:j + 1])))
+        j = i - 1
+    return sorted(centers)
@@ -0,0 +1,114 @@
+"""OCR fallback for scanned estimate pages.
+
+Pages without a text layer are rendered, hashed and run through Tesseract,
+a few pages at a time. Tesseract is started from the parse worker itself
+(pytesseract runs the binary), so it lives under the worker's memory cap and
+in its process group, which goes when the sandbox replaces the worker.
+Results come back as word tuples in PDF points, the same shape PyMuPDF's
+get_text("words") returns, so everything downstream works unchanged.
+
+OCR is slow (seconds per page at 300 DPI), so the parse job's time budget
+(sandbox PARSE_TIMEOUT_SECONDS) is extended by OCR_PAGE_TIMEOUT for every
+round of OCR_POOL_SIZE pages to OCR, up to PARSE_MAX_TIMEOUT_SECONDS.
+"""
+
+import hashlib
+import io
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import fitz
+
+from app.services import sandbox
+from app.services.parse_cache import ParseCache
+
+OCR_DPI = int(os.getenv("FLAGTECH_OCR_DPI", "300"))
+# Tesseract processes run at once per parse worker
+OCR_POOL_SIZE = int(os.getenv("FLAGTECH_OCR_POOL_SIZE", "2"))
+# Per page; also what each round of pages adds to the parse job's budget
+OCR_PAGE_TIMEOUT = float(os.getenv("FLAGTECH_OCR_PAGE_TIMEOUT", "30"))
+OCR_LANG = os.getenv("FLAGTECH_OCR_LANG", "eng")
+# Tesseract confidence below this is treated as noise
+OCR_MIN_CONFIDENCE = float(os.getenv("FLAGTECH_OCR_MIN_CONFIDENCE", "30"))
+
+# Keyed by rendered page-image hash, so the same scan is never OCR'd twice
+ocr_cache = ParseCache("ocr")
+
+
+def ocr_image(png: bytes, scale: float) -> List[tuple]:
+    """
+    OCR one rendered page (on an OCR thread). Returns word tuples
+    (x0, y0, x1, y1, text, block_no, line_no, word_no) scaled back to PDF points.
+    """
+    import pytesseract
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(png))
+    data = pytesseract.image_to_data(
+        image, lang=OCR_LANG, output_type=pytesseract.Output.DICT, timeout=OCR_PAGE_TIMEOUT
+    )
+
+    words = []
+    for i, text in enumerate(data["text"]):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            conf = float(data["conf"][i])
+        except (TypeError, ValueError):
+            conf = -1.0
+        if conf < OCR_MIN_CONFIDENCE:
+            continue
+        x0 = data["left"][i] / scale
+        y0 = data["top"][i] / scale
+        x1 = (data["left"][i] + data["width"][i]) / scale
+        y1 = (data["top"][i] + data["height"][i]) / scale
+        words.append((x0, y0, x1, y1, text, data["block_num"][i], data["line_num"][i], data["word_num"][i]))
+    return words
+
+
+def render_page(page, dpi: int = OCR_DPI):
+    """Render a page to grayscale PNG. Returns (png_bytes, image_hash, scale)."""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    png = pix.tobytes("png")
+    image_hash = hashlib.sha256(pix.samples).hexdigest()
+    return png, f"{image_hash}-{dpi}-{OCR_LANG}", dpi / 72.0
+
+
+def ocr_pages(pages: Dict[int, object], dpi: int = OCR_DPI) -> Dict[int, List[tuple]]:
+    """
+    OCR several pages in parallel. pages maps page number to fitz Page.
+    Returns page number -> word tuples. Cached pages are not re-submitted.
+    """
+    results: Dict[int, List[tuple]] = {}
+    futures = {}
+    rendered = {}
+
+    # Threads only wait on the Tesseract processes; none outlive this call
+    with ThreadPoolExecutor(max_workers=OCR_POOL_SIZE) as pool:
+        for pno, page in pages.items():
+            png, key, scale = render_page(page, dpi)
+            cached = ocr_cache.get(key)
+            if cached is not None:
+                results[pno] = cached
+                continue
+            rendered[pno] = key
+            futures[pno] = pool.submit(ocr_image, png, scale)
+
+        # Worst case every page runs to its timeout, OCR_POOL_SIZE at a time
+        sandbox.extend_budget(math.ceil(len(futures) / OCR_POOL_SIZE) * OCR_PAGE_TIMEOUT)
+
+        for pno, future in futures.items():
+            try:
+                words = future.result()
+            except Exception as e:
+                # Missing tesseract binary, a timeout or a bad image: the page just has no words
+                print(f"[ocr] page {pno + 1} failed: {e}")
+                results[pno] = []
+                continue
+            ocr_cache.put(rendered[pno], words)
+            results[pno] = words
+
+    return results
@@ -0,0 +1,104 @@
+"""Operation and description rules for labor/paint line items.
+
+All rules are compiled into one case-insensitive regex with a named group
+per rule, so a row's description is classified in a single scan instead of
+one substring check per rule. Operation codes found by a rule are
+normalized with helpers.normalize_operation, the same codes the text parser
+uses. Parses report how many rows each rule matched (see record_counts),
+for tuning the rule set against real estimates.
+
+Matches don't overlap (the scan resumes after each one), so rules must not
+match overlapping text, or the later one can be missed.
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Mapping, Optional, Sequence
+
+from app.utils.helpers import normalize_operation
+
+
+@dataclass(frozen=True)
+class OperationRule:
+    name: str
+    pattern: str                  # regex, matched case-insensitively anywhere in the description
+    operation: bool = False       # the matched text is an operation code
+    # True: a labor line even without hours (REPL, R&I); False: never a labor line (clear coat)
+    labor: Optional[bool] = None
+
+
+@dataclass(frozen=True)
+class RowClass:
+    rules: FrozenSet[str]
+    operation: Optional[str]      # first operation code in the description, normalized
+    force_labor: bool
+    no_labor: bool
+
+
+class OperationClassifier:
+    """Classifies descriptions against a fixed rule set in one regex scan."""
+
+    def __init__(self, rules: Sequence[OperationRule]):
+        self.rules = {rule.name: rule for rule in rules}
+        self._groups = {f"r{i}": rule for i, rule in enumerate(rules)}
+        self._pattern = re.compile(
+            "|".join(f"(?P<{group}>{rule.pattern})" for group, rule in self._groups.items()),
+            re.IGNORECASE,
+        )
+
+    def classify(self, description: str) -> RowClass:
+        """Rules matching the description, and what they decide for the row."""
+        matched = set()
+        operation = None
+        force_labor = no_labor = False
+        for m in self._pattern.finditer(description):
+            rule = self._groups[m.lastgroup]
+            if rule.name in matched:
+                continue
+            matched.add(rule.name)
+            if rule.operation and operation is None:
+                operation = normalize_operation(m.group())
+            if rule.labor is True:
+                force_labor = True
+            elif rule.labor is False:
+                no_labor = True
+        return RowClass(frozenset(matched), operation, force_labor, no_labor)
+
+
+def _code(code: str) -> str:
+    # Whole operation code, not part of a longer word
+    return rf"(?<![\w/&]){re.escape(code)}(?![\w/&])"
+
+
+# CCC rules. REPL and R&I match anywhere in the description, as the grid
+# always has; the other codes only as whole words.
+CCC_RULES = (
+    OperationRule("repl", r"repl", operation=True, labor=True),
+    OperationRule("r&i", r"r&i", operation=True, labor=True),
+    OperationRule("clear_coat", r"add for clear coat", labor=False),
+    OperationRule("rpr", _code("rpr"), operation=True),
+    OperationRule("refn", _code("refn"), operation=True),
+    OperationRule("blnd", _code("blnd"), operation=True),
+    OperationRule("o/h", _code("o/h"), operation=True),
+    OperationRule("sublet", _code("sublet"), operation=True),
+    OperationRule("algn", _code("algn"), operation=True),
+)
+
+ccc_operations = OperationClassifier(CCC_RULES)
+
+
+# Rows matched per rule by the parses this server process has received
+# results for. Rows are classified in the parse workers, which hand their
+# per-document counts back with the grid result.
+_rule_counts: Counter = Counter({rule.name: 0 for rule in CCC_RULES})
+
+
+def record_counts(counts: Mapping[str, int]):
+    """Add one parse's per-rule row counts to the totals."""
+    _rule_counts.update(counts)
+
+
+def stats() -> Dict[str, int]:
+    """Rows matched per rule since startup (rules that never matched included)."""
+    return dict(_rule_counts)
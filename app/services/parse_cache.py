@@ -0,0 +1,184 @@
+"""Content-hash cache for parse results.
+
+Entries live in a bounded in-memory LRU per server process, backed by an
+on-disk store that every gunicorn worker on the host shares.
+"""
+
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def _private_dir(path: str) -> str:
+    """
+    Create path (mode 0700) if needed and make sure it is this user's alone.
+    Entries are unpickled, so anyone who can write there can run code in the
+    server: a directory owned by another user is refused.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # stat follows symlinks, so a link planted in /tmp is judged by its target
+    st = os.stat(path)
+    if st.st_uid != os.getuid():
+        raise RuntimeError(
+            f"Cache directory {path} is owned by another user; set FLAGTECH_CACHE_DIR to a private directory."
+        )
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+CACHE_DIR = _private_dir(os.getenv("FLAGTECH_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "flagtech-cache"))
+CACHE_MEMORY_ENTRIES = int(os.getenv("FLAGTECH_CACHE_MEMORY_ENTRIES", "32"))
+CACHE_DISK_ENTRIES = int(os.getenv("FLAGTECH_CACHE_DISK_ENTRIES", "2000"))
+PAGE_CACHE_MEMORY_ENTRIES = int(os.getenv("FLAGTECH_PAGE_CACHE_MEMORY_ENTRIES", "1000"))
+PAGE_CACHE_DISK_ENTRIES = int(os.getenv("FLAGTECH_PAGE_CACHE_DISK_ENTRIES", "50000"))
+LAYOUT_CACHE_DISK_ENTRIES = int(os.getenv("FLAGTECH_LAYOUT_CACHE_DISK_ENTRIES", "1000"))
+TILE_CACHE_MEMORY_ENTRIES = int(os.getenv("FLAGTECH_TILE_CACHE_MEMORY_ENTRIES", "64"))
+TILE_CACHE_DISK_ENTRIES = int(os.getenv("FLAGTECH_TILE_CACHE_DISK_ENTRIES", "20000"))
+
+# Prune the disk store every N writes rather than on every put
+_PRUNE_EVERY = 50
+
+
+class ParseCache:
+    """LRU + shared-disk cache for one kind of parse output."""
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int = CACHE_MEMORY_ENTRIES,
+        max_disk_entries: int = CACHE_DISK_ENTRIES,
+        directory: str = CACHE_DIR,
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.directory = os.path.join(directory, namespace)
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _count(self, name: str):
+        # get/put run on several threads at once (asyncio.to_thread)
+        with self._lock:
+            self.counters[name] += 1
+
+    def _remember(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return self._entries[key]
+
+        try:
+            with open(self._path(key), "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        except Exception as e:
+            # Truncated or stale entry; treat as a miss and let the next put replace it
+            print(f"[parse_cache] unreadable {self.namespace} entry {key}: {e}")
+            self._count("misses")
+            return None
+
+        self._count("disk_hits")
+        self._remember(key, value)
+        return value
+
+    def contains(self, key: str) -> bool:
+        """Whether key is cached, in memory or on disk, without loading it."""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, value: Any):
+        """Store value in memory and on disk (atomically, so other workers never see a partial file)."""
+        self._remember(key, value)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"[parse_cache] could not write {self.namespace} entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Drop the oldest disk entries beyond max_disk_entries."""
+        try:
+            names = [n for n in os.listdir(self.directory) if n.endswith(".pkl")]
+        except OSError:
+            return
+        if len(names) <= self.max_disk_entries:
+            return
+
+        def mtime(name):
+            try:
+                return os.path.getmtime(os.path.join(self.directory, name))
+            except OSError:
+                return 0.0
+
+        names.sort(key=mtime)
+        for name in names[: len(names) - self.max_disk_entries]:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+                self._count("disk_evictions")
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for this process plus current memory occupancy."""
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+def cache_key(content_hash: str, version: str) -> str:
+    """Cache key for a document: content hash plus the parser version that produced it."""
+    return f"{content_hash}-v{version}"
+
+
+grid_cache = ParseCache("grid")
+
+# Per-page words and rows, keyed by page content hash (see extractor.page_content_hash)
+page_cache = ParseCache("pages", PAGE_CACHE_MEMORY_ENTRIES, PAGE_CACHE_DISK_ENTRIES)
+
+# Learned column layouts, keyed by page layout fingerprint (see grid_processor.layout_fingerprint)
+layout_cache = ParseCache("layouts", CACHE_MEMORY_ENTRIES, LAYOUT_CACHE_DISK_ENTRIES)
+
+# Rendered page images, keyed by page content hash, DPI and format (see tiles.tile_key)
+tile_cache = ParseCache("tiles", TILE_CACHE_MEMORY_ENTRIES, TILE_CACHE_DISK_ENTRIES)
@@ -0,0 +1,368 @@
+"""Process pool that keeps PDF parsing off the event loop.
+
+PyMuPDF extraction and the grid code are CPU-bound, so every parse runs in a
+warm sandboxed worker (see sandbox.py) and the async routes only await the result.
+"""
+
+import asyncio
+import os
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import fitz
+from fastapi import HTTPException
+
+from app.models.estimate import EstimateResponse, LineItem
+from app.services import formats, sandbox
+from app.services.document import ParsedDocument
+from app.services.extractor import extract_line_item_pages, extract_text_from_pdf
+from app.services.grid_processor import (
+    PARSER_VERSION,
+    aligned_rows_by_page,
+)
+from app.services.parse_cache import cache_key, grid_cache, tile_cache
+from app.services import operations
+from app.services.parser import parse_estimate_text
+from app.services.single_flight import single_flight
+from app.services.tiles import keep_source, render_tile_job
+from app.services.jobs import create_job, record_progress, update_job
+from app.services.uploads import BatchEntry, SpooledUpload, spool_upload
+
+
+def start_parse_pool(size: Optional[int] = None) -> sandbox.SandboxPool:
+    """Start the sandboxed parse workers (once per server process)."""
+    return sandbox.start_pool(size)
+
+
+def shutdown_parse_pool():
+    """Stop the parse workers."""
+    sandbox.shutdown_pool()
+
+
+async def run_in_pool(fn: Callable, *args) -> Any:
+    """
+    Run a picklable top-level function on a parse worker and await its result.
+    Over-budget documents raise HTTPException (422), a crashed worker 503.
+    """
+    return await sandbox.run(fn, *args)
+
+
+def _error_detail(e: Exception) -> str:
+    return e.detail if isinstance(e, HTTPException) else str(e)
+
+
+def _open(pdf_path: str) -> ParsedDocument:
+    """
+    Open a spooled PDF inside a worker, enforcing the page budget. Batch
+    documents arrive without a page count, so this is where theirs is checked.
+    """
+    try:
+        doc = ParsedDocument(pdf_path)
+    except fitz.FileDataError:
+        raise sandbox.JobRejected("File is not a readable PDF.")
+    try:
+        sandbox.check_page_budget(doc.page_count)
+    except sandbox.BudgetExceeded:
+        doc.close()
+        raise
+    return doc
+
+
+# ---------------------------------------------------------
+# WORKER JOBS (run inside the pool processes)
+# ---------------------------------------------------------
+
+def grid_job(pdf_path: str, key: str, job_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Fingerprint the estimate format, then run its grid pipeline: extract the
+    line-item region, build the grid and each page's visualization (key is
+    the grid cache key the fragments link back to). With a job_id, page
+    progress is written to the job record.
+    """
+    on_page = None
+    if job_id:
+        on_page = lambda done, total: record_progress(job_id, done, total)
+
+    with _open(pdf_path) as doc:
+        return formats.format_for(doc).grid(doc, on_page, key)
+
+
+def line_items_job(pdf_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming grid parse: yields each labor/paint item as soon as its page
+    has been read (see grid_processor.iter_line_items), then the line-item
+    region the single pass found.
+    """
+    region = {}
+    with _open(pdf_path) as doc:
+        for item in formats.format_for(doc).line_items(doc, region):
+            yield {"type": "item", **item}
+    yield {"type": "region", **region}
+
+
+def aligned_job(pdf_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming aligned table: the line-item region is read with the grid
+    pipeline's extraction, the five columns are clustered once, then rows
+    go out a page at a time as {"type": "rows", "page", "rows"}. A document
+    without usable words yields a single {"type": "error", "error"}.
+    """
+    with _open(pdf_path) as doc:
+        pages, region = extract_line_item_pages(doc)
+    if not any(page.get("words") for page in pages):
+        yield {"type": "error", "error": "No words found in PDF."}
+        return
+
+    by_page = aligned_rows_by_page(pages, region)
+    if by_page is None:
+        yield {"type": "error", "error": "Could not compute columns."}
+        return
+    for pi, rows in by_page:
+        yield {"type": "rows", "page": pi, "rows": rows}
+
+
+def text_items_job(pdf_path: str) -> Dict[str, Any]:
+    """Extract raw text and parse it into line items."""
+    with _open(pdf_path) as doc:
+        text = extract_text_from_pdf(doc)
+    return {"text": text, "items": parse_estimate_text(text)}
+
+
+# ---------------------------------------------------------
+# ASYNC API (used by the routes)
+# ---------------------------------------------------------
+
+async def grid_for_upload(upload: SpooledUpload, job_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Grid-parse a spooled upload, via the cache and single-flight. Returns
+    {"result", "pages", "key"}: pages are the per-page visualization
+    fragments, served by key from the grid cache (see page_fragment).
+    """
+    key = cache_key(upload.sha256, PARSER_VERSION)
+    cached = await asyncio.to_thread(grid_cache.get, key)
+    if cached is not None:
+        return cached
+
+    async def run(path: str):
+        parsed = await run_in_pool(grid_job, path, key, job_id)
+        parsed["key"] = key
+        if parsed["result"] is not None:
+            operations.record_counts(parsed["result"]["operation_counts"])
+            # The page tiles are rendered from the upload when first requested
+            await asyncio.to_thread(keep_source, path, upload.sha256)
+            await asyncio.to_thread(grid_cache.put, key, parsed)
+        return parsed
+
+    # Identical uploads in flight (here or in another worker) share one parse,
+    # on its own link to the upload (see single_flight)
+    return await single_flight(key, run, lambda: grid_cache.get(key), upload.path)
+
+
+async def parse_grid(file) -> Dict[str, Any]:
+    """Grid-parse an uploaded PDF. Returns {"result", "pages", "key"}."""
+    async with spool_upload(file) as upload:
+        return await grid_for_upload(upload)
+
+
+async def page_fragment(key: str, page: int) -> Optional[Dict[str, Any]]:
+    """One page's visualization fragment from a cached grid parse, or None if it isn't cached."""
+    parsed = await asyncio.to_thread(grid_cache.get, key)
+    if parsed is None:
+        return None
+    return next((fragment for fragment in parsed["pages"] if fragment["page"] == page), None)
+
+
+async def page_tile(key: str, doc_key: str, page: int) -> Optional[bytes]:
+    """
+    A page tile from the tile cache, rendered on a parse worker on a miss.
+    doc_key and page must name a cached grid page showing that tile (so only
+    tiles of parsed documents get rendered). None if the tile can't be had.
+    """
+    image = await asyncio.to_thread(tile_cache.get, key)
+    if image is not None:
+        return image
+    fragment = await page_fragment(doc_key, page)
+    if fragment is None or fragment.get("tile") != key:
+        return None
+    sha256 = doc_key.rsplit("-v", 1)[0]
+    return await run_in_pool(render_tile_job, sha256, page, key)
+
+
+# Background job tasks; held so they aren't garbage-collected mid-parse
+_job_tasks = set()
+
+
+async def _run_grid_job(job_id: str, upload: SpooledUpload):
+    try:
+        update_job(job_id, status="running", progress={"page": 0, "pages": upload.page_count})
+        parsed = await grid_for_upload(upload, job_id)
+        result = parsed["result"]
+        if result is None:
+            update_job(job_id, status="error", error="No words found in PDF.")
+            return
+        update_job(
+            job_id,
+            status="done",
+            progress={"page": upload.page_count, "pages": upload.page_count},
+            cache_key=cache_key(upload.sha256, PARSER_VERSION),
+            result={
+                "labor_items": result["labor_items"],
+                "paint_items": result["paint_items"],
+                "total_labor": result["total_labor"],
+                "total_paint": result["total_paint"],
+                "second_ro_line": result["second_ro_line"],
+                "vehicle_info_line": result["vehicle_info_line"],
+            },
+        )
+    except Exception as e:
+        print(f"[parse_pool] job {job_id} failed: {e}")
+        update_job(job_id, status="error", error=_error_detail(e))
+    finally:
+        try:
+            os.unlink(upload.path)
+        except OSError:
+            pass
+
+
+async def start_grid_job(file) -> str:
+    """
+    Spool an upload and start grid-parsing it in the background.
+    Returns the job id right away; size/page rejections still raise here.
+    """
+    async with spool_upload(file, keep=True) as upload:
+        job_id = create_job(file.filename or "")
+    task = asyncio.create_task(_run_grid_job(job_id, upload))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+    return job_id
+
+
+async def _batch_result(entry: BatchEntry) -> Dict[str, Any]:
+    if entry.error:
+        return {"filename": entry.filename, "error": entry.error}
+    try:
+        parsed = await grid_for_upload(entry.upload)
+    except Exception as e:
+        print(f"[parse_pool] batch parse of {entry.filename} failed: {e}")
+        return {"filename": entry.filename, "error": _error_detail(e)}
+
+    result = parsed["result"]
+    if result is None:
+        return {"filename": entry.filename, "error": "No words found in PDF."}
+    return {
+        "filename": entry.filename,
+        "sha256": entry.upload.sha256,
+        "second_ro_line": result["second_ro_line"],
+        "vehicle_info_line": result["vehicle_info_line"],
+        "labor_items": result["labor_items"],
+        "paint_items": result["paint_items"],
+        "total_labor": result["total_labor"],
+        "total_paint": result["total_paint"],
+    }
+
+
+async def parse_batch(entries: List[BatchEntry]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Grid-parse every spooled document in a batch at once (the pool spreads
+    them over its workers) and yield one result per document as it finishes.
+    """
+    tasks = [asyncio.ensure_future(_batch_result(entry)) for entry in entries]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away mid-stream: stop waiting, and single_flight cancels
+        # every parse no other request is waiting for
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_line_items(upload: SpooledUpload) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Grid-parse a spooled upload and yield its items while the worker is
+    still reading later pages: one "item" line per labor or paint item, the
+    "region" they came from, then "done" with the totals. Failures after
+    the first line can't change the HTTP status any more, so they end the
+    stream with an "error" line.
+    """
+    totals = {"labor": 0, "paint": 0}
+    try:
+        async with aclosing(sandbox.stream(line_items_job, upload.path)) as lines:
+            async for line in lines:
+                if line["type"] == "item":
+                    totals[line["kind"]] += line["value"]
+                yield line
+    except Exception as e:
+        print(f"[parse_pool] item stream for {upload.sha256[:12]} failed: {e}")
+        yield {"type": "error", "error": _error_detail(e)}
+        return
+    yield {"type": "done", "total_labor": totals["labor"], "total_paint": totals["paint"]}
+
+
+def stream_aligned(upload: SpooledUpload) -> AsyncIterator[Dict[str, Any]]:
+    """Aligned-table messages for a spooled upload, as aligned_job yields them."""
+    return sandbox.stream(aligned_job, upload.path)
+
+
+async def parse_text_items(file) -> Dict[str, Any]:
+    """Extract text and line items from an uploaded PDF. Returns {"text", "items"}."""
+    async with spool_upload(file) as upload:
+        return await run_in_pool(text_items_job, upload.path)
+
+
+def estimate_line_items(result: Dict[str, Any]) -> List[LineItem]:
+    """
+    One LineItem per estimate line from a grid result, with its labor and
+    paint hours together. A line printed with both has one labor and one
+    paint item (same line and description); they are paired in order.
+    """
+    items: List[LineItem] = []
+    open_labor: Dict[tuple, List[LineItem]] = {}
+
+    for entry in result["labor_items"]:
+        item = LineItem(
+            line=int(entry["line"]),
+            operation=entry["operation"],
+            description=entry["description"],
+            labor=entry["value"],
+            paint=None,
+        )
+        items.append(item)
+        open_labor.setdefault((entry["line"], entry["description"]), []).append(item)
+
+    for entry in result["paint_items"]:
+        waiting = open_labor.get((entry["line"], entry["description"]))
+        if waiting:
+            waiting.pop(0).paint = entry["value"]
+            continue
+        items.append(LineItem(
+            line=int(entry["line"]),
+            operation=entry["operation"],
+            description=entry["description"],
+            labor=None,
+            paint=entry["value"],
+        ))
+
+    # Paint-only lines went last; put everything back in printed line order
+    items.sort(key=lambda item: item.line)
+    return items
+
+
+async def parse_estimate(file) -> EstimateResponse:
+    """
+    Parse an uploaded estimate into line items with labor and paint hours,
+    using the grid pipeline (all pages, one pass, shared parse cache).
+    """
+    async with spool_upload(file) as upload:
+        parsed = await grid_for_upload(upload)
+
+    result = parsed["result"]
+    if result is None:
+        return EstimateResponse(line_items=[])
+    return EstimateResponse(
+        line_items=estimate_line_items(result),
+        total_labor=result["total_labor"],
+        total_paint=result["total_paint"],
+        second_ro_line=result["second_ro_line"],
+        vehicle_info_line=result["vehicle_info_line"],
+    )
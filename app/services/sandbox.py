@@ -0,0 +1,364 @@
+"""Sandboxed worker processes for everything that opens an uploaded PDF.
+
+Each worker is a spawned child with an RLIMIT_AS memory cap. A job gets a
+wall-clock budget; a worker that overruns it is SIGKILLed and replaced, and
+the request gets a clean HTTP error instead of pinning a server process
+inside fitz.open or get_text. Jobs can also enforce a page budget.
+
+Workers lead their own process group, so replacing one also kills anything
+it started (Tesseract for scanned pages). A job whose size is only known
+once it runs can ask for more time with extend_budget.
+
+Quick checks on a fresh upload (page counts) run on a separate small probe
+pool, so they never wait behind long parses.
+"""
+
+import asyncio
+import atexit
+import multiprocessing
+import os
+import signal
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+PARSE_POOL_SIZE = int(os.getenv("FLAGTECH_PARSE_POOL_SIZE", "2"))
+PARSE_TIMEOUT_SECONDS = float(os.getenv("FLAGTECH_PARSE_TIMEOUT", "60"))
+# Ceiling for a job's budget once extend_budget has added to it
+PARSE_MAX_TIMEOUT_SECONDS = float(os.getenv("FLAGTECH_PARSE_MAX_TIMEOUT", "600"))
+# Address-space cap per worker; 0 disables it
+PARSE_MEMORY_MB = int(os.getenv("FLAGTECH_PARSE_MEMORY_MB", "2048"))
+# The one page cap: uploads reject over it up front, parse jobs for documents that skipped that check
+PARSE_PAGE_BUDGET = int(os.getenv("FLAGTECH_MAX_PDF_PAGES", "60"))
+PROBE_POOL_SIZE = int(os.getenv("FLAGTECH_PROBE_POOL_SIZE", "1"))
+PROBE_TIMEOUT_SECONDS = float(os.getenv("FLAGTECH_PROBE_TIMEOUT", "10"))
+
+
+class JobRejected(Exception):
+    """Raised inside a worker for a document the job refuses to parse; the request gets a 422."""
+
+
+class BudgetExceeded(JobRejected):
+    """Raised inside a worker when a document is over a budget it can check itself."""
+
+
+def check_page_budget(page_count: int):
+    if page_count > PARSE_PAGE_BUDGET:
+        raise BudgetExceeded(f"PDF has {page_count} pages; the parse budget is {PARSE_PAGE_BUDGET}.")
+
+
+def _limit_memory():
+    if PARSE_MEMORY_MB > 0:
+        import resource
+
+        limit = PARSE_MEMORY_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+# Inside a worker, the pipe to the pool (see extend_budget)
+_conn = None
+
+
+def extend_budget(seconds: float):
+    """
+    Add seconds to the running job's time budget, up to PARSE_MAX_TIMEOUT_SECONDS
+    in all. Does nothing outside a sandbox worker.
+    """
+    if _conn is not None and seconds > 0:
+        _conn.send(("extend", seconds))
+
+
+def _out_of_memory(e: BaseException) -> bool:
+    """MemoryError, or MuPDF failing an allocation under the RLIMIT_AS cap (an FzErrorSystem)."""
+    import fitz
+
+    if isinstance(e, MemoryError):
+        return True
+    return isinstance(e, fitz.mupdf.FzErrorSystem) and "malloc" in str(e)
+
+
+def _error_reply(e: BaseException) -> Tuple[str, Any]:
+    """
+    A failed job's reply, built from plain values: MuPDF exceptions hold SWIG
+    objects that can't be pickled, so no exception is sent back as is.
+    """
+    import fitz
+
+    if _out_of_memory(e):
+        return ("memory", str(e))
+    if isinstance(e, JobRejected):
+        return ("rejected", (isinstance(e, BudgetExceeded), str(e)))
+    if isinstance(e, fitz.mupdf.FzErrorBase):
+        return ("rejected", (False, f"PDF could not be parsed: {e}"))
+    return ("error", (type(e).__name__, str(e)))
+
+
+def _worker_main(conn):
+    """
+    Worker loop: receive (fn, args, streaming) and send back ("ok", result),
+    or a failure from _error_reply: ("memory", message), ("rejected",
+    (over_budget, message)) or ("error", (exception type name, message)).
+    A streaming job is a generator; each value it yields is sent as
+    ("item", value) before the final ("ok", None). extend_budget sends
+    ("extend", seconds) at any point.
+    """
+    global _conn
+    _conn = conn
+    # Own process group, so _Worker.kill takes Tesseract children with it
+    os.setpgrp()
+    _limit_memory()
+    # Pre-import the job modules (and through them PyMuPDF, numpy and the
+    # parsers) so the first job on a worker doesn't pay for it
+    import app.services.parse_pool  # noqa: F401
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        fn, args, streaming = message
+        try:
+            if streaming:
+                for item in fn(*args):
+                    conn.send(("item", item))
+                reply = ("ok", None)
+            else:
+                reply = ("ok", fn(*args))
+        except BaseException as e:
+            reply = _error_reply(e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Unpicklable result; report it rather than hang the caller
+            conn.send(("error", (type(e).__name__, f"Could not return job result: {e}")))
+
+
+def _receive(conn, timeout: float) -> List[Tuple[str, Any]]:
+    """Wait up to timeout for a reply, then take every reply already queued behind it."""
+    if not conn.poll(timeout):
+        return []
+    replies = [conn.recv()]
+    while replies[-1][0] in ("item", "extend") and conn.poll():
+        replies.append(conn.recv())
+    return replies
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            # Not yet its own group leader
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class SandboxPool:
+    """Fixed-size set of sandboxed workers, handed out one job at a time."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers: List[_Worker] = [_Worker(self._ctx) for _ in range(size)]
+        self._idle: "asyncio.Queue[_Worker]" = asyncio.Queue()
+        for worker in self._workers:
+            self._idle.put_nowait(worker)
+        self.counters = {
+            "jobs": 0,
+            "killed_timeout": 0,
+            "killed_memory": 0,
+            "killed_crashed": 0,
+            "killed_cancelled": 0,
+            "over_page_budget": 0,
+            "rejected": 0,
+            "failed": 0,
+        }
+
+    def _replace(self, worker: _Worker, reason: str) -> _Worker:
+        """Kill a worker, count why, and put a fresh one in its slot."""
+        worker.kill()
+        self.counters[f"killed_{reason}"] += 1
+        fresh = _Worker(self._ctx)
+        self._workers[self._workers.index(worker)] = fresh
+        print(f"[sandbox] replaced worker {worker.process.pid} ({reason}) with {fresh.process.pid}")
+        return fresh
+
+    async def _job(self, fn: Callable, args: tuple, streaming: bool, timeout: Optional[float]) -> AsyncIterator[Any]:
+        """
+        Run one job on an idle worker within the time budget, yielding what the
+        worker sends back: the items of a streaming job, or the single result.
+        """
+        timeout = timeout or PARSE_TIMEOUT_SECONDS
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + timeout
+        worker = await self._idle.get()
+        if not worker.alive():
+            worker = self._replace(worker, "crashed")
+
+        self.counters["jobs"] += 1
+        # Until the final reply is in, the worker is busy with this job
+        finished = False
+        try:
+            try:
+                worker.conn.send((fn, args, streaming))
+                while not finished:
+                    replies = await asyncio.to_thread(_receive, worker.conn, max(0.0, deadline - loop.time()))
+                    if not replies:
+                        break
+                    for kind, value in replies:
+                        if kind == "item":
+                            yield value
+                        elif kind == "extend":
+                            deadline = min(deadline + value, start + max(timeout, PARSE_MAX_TIMEOUT_SECONDS))
+                        else:
+                            finished = True
+            except (EOFError, OSError):
+                worker = self._replace(worker, "crashed")
+                finished = True
+                raise HTTPException(status_code=503, detail="Parse worker crashed; try again.")
+
+            if not finished:
+                worker = self._replace(worker, "timeout")
+                finished = True
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"PDF took longer than {deadline - start:.0f}s to parse and was abandoned.",
+                )
+            if kind == "memory":
+                # MuPDF may be left in a bad state after a failed allocation
+                worker = self._replace(worker, "memory")
+                raise HTTPException(status_code=422, detail="PDF needs more memory than the parse budget allows.")
+        finally:
+            if not finished:
+                # Cancelled, or the consumer stopped reading: nobody wants the rest, free the slot now
+                worker = self._replace(worker, "cancelled")
+            self._idle.put_nowait(worker)
+
+        if kind == "ok":
+            if not streaming:
+                yield value
+            return
+        if kind == "rejected":
+            over_budget, message = value
+            self.counters["over_page_budget" if over_budget else "rejected"] += 1
+            raise HTTPException(status_code=422, detail=message)
+        error_type, message = value
+        self.counters["failed"] += 1
+        print(f"[sandbox] {getattr(fn, '__name__', fn)} failed: {error_type}: {message}")
+        raise HTTPException(status_code=503, detail="PDF parse failed; try again.")
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """Run fn(*args) on an idle worker within the time budget and return its result."""
+        async with aclosing(self._job(fn, args, False, timeout)) as replies:
+            async for result in replies:
+                return result
+
+    async def stream(self, fn: Callable, *args, timeout: Optional[float] = None) -> AsyncIterator[Any]:
+        """
+        Run the generator function fn(*args) on an idle worker and yield its
+        values as they arrive. The time budget covers the whole job; closing
+        the iterator early abandons the job and replaces the worker.
+        """
+        async with aclosing(self._job(fn, args, True, timeout)) as items:
+            async for item in items:
+                yield item
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "workers": len(self._workers),
+            "idle": self._idle.qsize(),
+            "timeout_seconds": PARSE_TIMEOUT_SECONDS,
+            "memory_mb": PARSE_MEMORY_MB,
+            "page_budget": PARSE_PAGE_BUDGET,
+        }
+
+
+_pool: Optional[SandboxPool] = None
+_probe_pool: Optional[SandboxPool] = None
+
+
+def start_pool(size: Optional[int] = None) -> SandboxPool:
+    """Start the sandboxed workers (once per server process)."""
+    global _pool
+    if _pool is None:
+        size = size or PARSE_POOL_SIZE
+        _pool = SandboxPool(size)
+        print(f"[sandbox] started {size} parse workers")
+    return _pool
+
+
+def shutdown_pool():
+    """Stop every worker, probe workers included; jobs in flight are abandoned."""
+    global _pool, _probe_pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+    if _probe_pool is not None:
+        _probe_pool.shutdown()
+        _probe_pool = None
+
+
+async def run(fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+    """Run a picklable top-level function on a sandboxed worker, starting the pool if needed."""
+    return await start_pool().run(fn, *args, timeout=timeout)
+
+
+async def stream(fn: Callable, *args, timeout: Optional[float] = None) -> AsyncIterator[Any]:
+    """Run a picklable top-level generator function on a sandboxed worker and yield what it yields."""
+    async with aclosing(start_pool().stream(fn, *args, timeout=timeout)) as items:
+        async for item in items:
+            yield item
+
+
+async def probe(fn: Callable, *args) -> Any:
+    """
+    Run a quick picklable top-level function (such as a page count) on the
+    probe pool, starting it if needed, within PROBE_TIMEOUT_SECONDS.
+    """
+    global _probe_pool
+    if _probe_pool is None:
+        _probe_pool = SandboxPool(PROBE_POOL_SIZE)
+        print(f"[sandbox] started {PROBE_POOL_SIZE} probe workers")
+    return await _probe_pool.run(fn, *args, timeout=PROBE_TIMEOUT_SECONDS)
+
+
+# Stop workers cleanly on exit rather than leaving it to daemon termination
+atexit.register(shutdown_pool)
+
+
+def stats() -> Dict[str, Any]:
+    """Job and kill counters for this server process's workers."""
+    stats = _pool.stats() if _pool is not None else {"workers": 0}
+    stats["probe"] = _probe_pool.stats() if _probe_pool is not None else {"workers": 0}
+    return stats
@@ -0,0 +1,179 @@
+"""Coalesce concurrent parses of the same document into one job.
+
+Within a server process, requests for the same key await one shared task.
+Across gunicorn workers, the task holds an flock on a per-key lock file in the
+shared cache directory; a worker that has to wait for the lock checks the
+shared cache again before doing any work itself.
+
+The shared task owns its input: the leading request's spooled file is
+hard-linked into the cache directory, so that request's cleanup can't remove
+it from under the others. When the last waiting request goes away the task
+is cancelled rather than left running for nobody.
+"""
+
+import asyncio
+import fcntl
+import os
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.services.parse_cache import CACHE_DIR
+
+LOCK_DIR = os.path.join(CACHE_DIR, "locks")
+LOCK_POLL_SECONDS = 0.05
+# Inputs of in-flight tasks; ones older than this were left by a crashed server
+INPUT_DIR = os.path.join(CACHE_DIR, "inputs")
+STALE_INPUT_SECONDS = 3600
+
+_inflight: Dict[str, "asyncio.Task"] = {}
+_waiters: Dict[str, int] = {}
+
+counters = {
+    "leaders": 0,
+    "joined_local": 0,
+    "joined_remote": 0,
+    "abandoned": 0,
+}
+
+
+def _is_current(fd: int, path: str) -> bool:
+    """Whether fd is still the lock file at path (the last holder may have unlinked it)."""
+    try:
+        return os.stat(path).st_ino == os.fstat(fd).st_ino
+    except FileNotFoundError:
+        return False
+
+
+@asynccontextmanager
+async def _file_lock(key: str):
+    """
+    Exclusive cross-process lock for key. Polls so a cancelled waiter never
+    holds it. The holder removes the lock file before releasing it, so lock
+    files don't pile up; a waiter that then gets the lock on the removed file
+    starts over on a fresh one.
+    """
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    path = os.path.join(LOCK_DIR, f"{key}.lock")
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(LOCK_POLL_SECONDS)
+        except BaseException:
+            os.close(fd)
+            raise
+        if _is_current(fd, path):
+            break
+        os.close(fd)
+
+    try:
+        yield
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        # Closing the descriptor releases the lock (also on crash, which leaves the file behind)
+        os.close(fd)
+
+
+def _sweep_inputs():
+    now = time.time()
+    for name in os.listdir(INPUT_DIR):
+        path = os.path.join(INPUT_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > STALE_INPUT_SECONDS:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def _own_input(key: str, source: str) -> str:
+    """Hard-link (or, across filesystems, copy) a caller's file into INPUT_DIR for the task."""
+    os.makedirs(INPUT_DIR, exist_ok=True)
+    _sweep_inputs()
+    fd, path = tempfile.mkstemp(prefix=f"{key}-", dir=INPUT_DIR)
+    os.close(fd)
+    os.unlink(path)
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)
+    return path
+
+
+async def _lead(
+    key: str,
+    run: Callable[[str], Awaitable[Any]],
+    lookup: Callable[[], Optional[Any]],
+    path: str,
+) -> Any:
+    try:
+        async with _file_lock(key):
+            # Another worker may have finished this document while we waited for the lock
+            value = await asyncio.to_thread(lookup)
+            if value is not None:
+                counters["joined_remote"] += 1
+                return value
+            counters["leaders"] += 1
+            return await run(path)
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _forget(key: str, task: "asyncio.Task"):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the exception retrieved even if every waiter went away
+    if not task.cancelled():
+        task.exception()
+
+
+async def single_flight(
+    key: str,
+    run: Callable[[str], Awaitable[Any]],
+    lookup: Callable[[], Optional[Any]],
+    source: str,
+) -> Any:
+    """
+    Return run(path)'s result for key, sharing one execution between
+    concurrent callers. path is the task's own link to the first caller's
+    source file. lookup() checks the shared cache; run() is expected to populate it.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        # Its own task, so one caller disconnecting doesn't cancel the parse for the others
+        task = asyncio.ensure_future(_lead(key, run, lookup, _own_input(key, source)))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget(key, t))
+    else:
+        counters["joined_local"] += 1
+
+    _waiters[key] = _waiters.get(key, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    finally:
+        _waiters[key] -= 1
+        if not _waiters[key]:
+            del _waiters[key]
+            if not task.done():
+                # Nobody wants the result any more; later callers start afresh
+                counters["abandoned"] += 1
+                if _inflight.get(key) is task:
+                    del _inflight[key]
+                task.cancel()
+
+
+def stats() -> Dict[str, Any]:
+    """Coalescing counters for this process."""
+    return {**counters, "in_flight": len(_inflight)}
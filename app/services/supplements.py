@@ -0,0 +1,127 @@
+"""Supplement diffs: what changed between two parses of the same RO.
+
+A supplement is the whole estimate printed again with a few lines added,
+removed or revised. Items are matched by line number and description, so
+only the lines that actually differ need re-assigning.
+"""
+
+import re
+from collections import Counter, defaultdict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# "RO 12345 Supplement S01", "RO Number: 12345" -> "12345"
+RO_NUMBER_PATTERN = re.compile(r"\bRO\b(?:\s*(?:Number|No\.?|#))?\s*:?\s*([A-Za-z0-9][A-Za-z0-9-]*)")
+# The same pattern for Postgres substring(... from ...), where \y is the word boundary
+RO_NUMBER_SQL_PATTERN = RO_NUMBER_PATTERN.pattern.replace(r"\b", r"\y")
+
+
+def ro_number(ro_line: str) -> Optional[str]:
+    """The RO number from an RO line, the same for the original and every supplement."""
+    m = RO_NUMBER_PATTERN.search(ro_line or "")
+    return m.group(1) if m else None
+
+
+def _value(item: Dict) -> float:
+    return float(item.get("value") or 0.0)
+
+
+def diff_items(old: List[Dict], new: List[Dict]) -> Dict[str, List]:
+    """
+    Compare two item lists ({"line", "description", "value"}). Items pair up
+    by line and description first (repeats in order), then leftovers by line
+    number alone (a revised description). Returns {"added": [new items],
+    "removed": [old items], "changed": [{"old", "new"}]}; the old and new
+    items are the dicts passed in.
+    """
+    by_key = defaultdict(deque)
+    for item in old:
+        by_key[(str(item.get("line")), item.get("description"))].append(item)
+
+    changed = []
+    unmatched_new = []
+    for item in new:
+        waiting = by_key.get((str(item.get("line")), item.get("description")))
+        if waiting:
+            prev = waiting.popleft()
+            if _value(prev) != _value(item):
+                changed.append({"old": prev, "new": item})
+        else:
+            unmatched_new.append(item)
+
+    # Same line number, new description
+    by_line = defaultdict(deque)
+    for items in by_key.values():
+        for item in items:
+            by_line[str(item.get("line"))].append(item)
+    matched = set()
+    added = []
+    for item in unmatched_new:
+        waiting = by_line.get(str(item.get("line")))
+        if waiting:
+            prev = waiting.popleft()
+            matched.add(id(prev))
+            changed.append({"old": prev, "new": item})
+        else:
+            added.append(item)
+
+    removed = [item for items in by_line.values() for item in items if id(item) not in matched]
+    # by_line holds each leftover old item once; keep them in their original order
+    order = {id(item): i for i, item in enumerate(old)}
+    removed.sort(key=lambda item: order[id(item)])
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def _item_key(item: Dict) -> Tuple:
+    return (str(item.get("line")), item.get("description"), _value(item))
+
+
+def apply_item_diff(
+    assigned: List[Dict],
+    unassigned: List[Dict],
+    diff: Dict[str, List],
+    add: bool = False,
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Apply a diff (from diff_items against the RO's last stored parse) to one
+    saved assignment's item lists. Items are found by line, description and
+    value, since each saved row holds its own copies: changed lines keep
+    their place (assigned or not) with the new values, removed lines are
+    dropped, and with add the added lines go to unassigned until someone
+    assigns them. Returns (assigned, unassigned).
+    """
+    removed = Counter(_item_key(item) for item in diff["removed"])
+    replaced = defaultdict(deque)
+    for change in diff["changed"]:
+        replaced[_item_key(change["old"])].append(change["new"])
+
+    def update(items: List[Dict]) -> List[Dict]:
+        kept = []
+        for item in items:
+            key = _item_key(item)
+            if removed[key]:
+                removed[key] -= 1
+            elif replaced.get(key):
+                kept.append(dict(replaced[key].popleft()))
+            else:
+                kept.append(dict(item))
+        return kept
+
+    assigned, unassigned = update(assigned), update(unassigned)
+    if add:
+        unassigned += [dict(item) for item in diff["added"]]
+    return assigned, unassigned
+
+
+def diff_summary(diff: Dict[str, List]) -> Dict[str, Any]:
+    """Counts and net hours of a diff, for logging and API responses."""
+    delta = (
+        sum(_value(item) for item in diff["added"])
+        - sum(_value(item) for item in diff["removed"])
+        + sum(_value(change["new"]) - _value(change["old"]) for change in diff["changed"])
+    )
+    return {
+        "added": len(diff["added"]),
+        "removed": len(diff["removed"]),
+        "changed": len(diff["changed"]),
+        "hours_delta": round(delta, 2),
+    }
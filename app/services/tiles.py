@@ -0,0 +1,125 @@
+"""Rendered page images for the grid view.
+
+The grid view shows each page as an image with the extracted rows outlined
+on top, instead of rebuilding the page from positioned text. The parse only
+names each page's tile (by the page's content hash); the tile is rendered
+by a parse worker the first time the browser asks for it, from the upload
+kept (as a link to the spooled file) under CACHE_DIR/sources, and kept in
+the tile cache, so a reprinted supplement page is never rendered twice.
+"""
+
+import io
+import os
+import re
+import shutil
+import tempfile
+from typing import Optional
+
+import fitz
+
+from app.services.parse_cache import CACHE_DIR, tile_cache
+
+# 0 turns tiles off; the grid view then draws the page's words instead
+TILE_DPI = int(os.getenv("FLAGTECH_TILE_DPI", "110"))
+TILE_FORMAT = os.getenv("FLAGTECH_TILE_FORMAT", "webp").lower()
+TILE_WEBP_QUALITY = int(os.getenv("FLAGTECH_TILE_WEBP_QUALITY", "80"))
+# Uploads kept for rendering their tiles, by sha256; the oldest go past this many
+SOURCE_DIR = os.path.join(CACHE_DIR, "sources")
+SOURCE_MAX_FILES = int(os.getenv("FLAGTECH_SOURCE_MAX_FILES", "200"))
+
+MEDIA_TYPES = {"webp": "image/webp", "png": "image/png"}
+
+# <page content hash>-<dpi>.<format>
+TILE_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}-\d+\.(webp|png)$")
+
+
+def tiles_enabled() -> bool:
+    return TILE_DPI > 0 and TILE_FORMAT in MEDIA_TYPES
+
+
+def tile_key(content_hash: str) -> str:
+    """Tile cache key (and URL name) for a page at the configured DPI and format."""
+    return f"{content_hash}-{TILE_DPI}.{TILE_FORMAT}"
+
+
+def tile_url(key: str, doc_key: str, page: int) -> str:
+    """Tile URL; the document's grid cache key and page say where to render it from on a miss."""
+    return f"/ui/tiles/{key}?doc={doc_key}&page={page}"
+
+
+def render_tile(page) -> bytes:
+    """Render a fitz Page to image bytes in the configured format."""
+    pix = page.get_pixmap(dpi=TILE_DPI, alpha=False)
+    if TILE_FORMAT == "webp":
+        from PIL import Image
+
+        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        buf = io.BytesIO()
+        image.save(buf, "WEBP", quality=TILE_WEBP_QUALITY)
+        return buf.getvalue()
+    return pix.tobytes("png")
+
+
+def source_path(sha256: str) -> str:
+    return os.path.join(SOURCE_DIR, f"{sha256}.pdf")
+
+
+def _prune_sources():
+    """Drop the oldest kept uploads beyond SOURCE_MAX_FILES."""
+    names = [n for n in os.listdir(SOURCE_DIR) if n.endswith(".pdf")]
+    if len(names) <= SOURCE_MAX_FILES:
+        return
+
+    def mtime(name):
+        try:
+            return os.path.getmtime(os.path.join(SOURCE_DIR, name))
+        except OSError:
+            return 0.0
+
+    names.sort(key=mtime)
+    for name in names[: len(names) - SOURCE_MAX_FILES]:
+        try:
+            os.unlink(os.path.join(SOURCE_DIR, name))
+        except OSError:
+            pass
+
+
+def keep_source(path: str, sha256: str):
+    """
+    Keep an uploaded PDF for rendering its tiles later: a hard link to the
+    spooled file (a copy across filesystems), never read into memory.
+    """
+    if not tiles_enabled() or os.path.exists(source_path(sha256)):
+        return
+    try:
+        os.makedirs(SOURCE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=SOURCE_DIR, suffix=".tmp")
+        os.close(fd)
+        os.unlink(tmp_path)
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, source_path(sha256))
+        _prune_sources()
+    except OSError as e:
+        print(f"[tiles] could not keep upload {sha256[:12]}: {e}")
+
+
+def render_tile_job(sha256: str, page: int, key: str) -> Optional[bytes]:
+    """
+    Render page (1-based) of a kept upload into the tile cache and return
+    the image, or None if the upload is no longer kept. Runs in a parse worker.
+    """
+    try:
+        doc = fitz.open(source_path(sha256), filetype="pdf")
+    except fitz.FileNotFoundError:
+        return None
+    with doc:
+        image = render_tile(doc[page - 1])
+    tile_cache.put(key, image)
+    return image
+
+
+def media_type(key: str) -> str:
+    return MEDIA_TYPES[key.rsplit(".", 1)[1]]
@@ -0,0 +1,295 @@
+"""Stream uploaded PDFs to disk so they are parsed by path, never held in memory."""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import zipfile
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from typing import List, Optional
+
+import fitz
+from fastapi import HTTPException
+
+from app.services import sandbox
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("FLAGTECH_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+MAX_PDF_PAGES = sandbox.PARSE_PAGE_BUDGET
+UPLOAD_DIR = os.getenv("FLAGTECH_UPLOAD_DIR") or None
+MAX_BATCH_FILES = int(os.getenv("FLAGTECH_MAX_BATCH_FILES", "100"))
+MAX_ZIP_BYTES = int(os.getenv("FLAGTECH_MAX_ZIP_BYTES", str(250 * 1024 * 1024)))
+# Total size of a batch's PDFs once ZIPs are expanded
+MAX_BATCH_BYTES = int(os.getenv("FLAGTECH_MAX_BATCH_BYTES", str(500 * 1024 * 1024)))
+
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+
+@dataclass
+class SpooledUpload:
+    """An upload copied to a temp file on disk."""
+    path: str
+    size: int
+    # None when the page cap is left to the parse job (batch documents)
+    page_count: Optional[int]
+    sha256: str
+
+
+def count_pages(path: str) -> Optional[int]:
+    """
+    Open a PDF by path and return its page count (reads the xref, not the
+    pages), or None if it won't open. Runs on the sandbox's probe pool.
+    """
+    try:
+        doc = fitz.open(path, filetype="pdf")
+    except Exception:
+        return None
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+
+def _too_large() -> HTTPException:
+    limit_mb = MAX_UPLOAD_BYTES / (1024 * 1024)
+    return HTTPException(status_code=413, detail=f"PDF is larger than the {limit_mb:.0f} MB upload limit.")
+
+
+def _check_chunk(size: int, chunk: bytes) -> int:
+    """Header and byte-cap checks for the next chunk of a PDF; returns the new size."""
+    if size == 0 and not chunk.lstrip().startswith(b"%PDF"):
+        raise HTTPException(status_code=415, detail="Upload is not a PDF.")
+    size += len(chunk)
+    if size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+    return size
+
+
+def _check_empty(size: int):
+    if size == 0:
+        raise HTTPException(status_code=422, detail="Uploaded file is empty.")
+
+
+async def _check_pages(path: str, size: int) -> int:
+    """Empty-file and page-cap checks once a PDF is on disk; returns its page count."""
+    _check_empty(size)
+    # Even opening a hostile PDF can hang, so it happens in the sandbox, not here;
+    # on the probe pool, so a cache hit never waits behind other uploads' parses
+    page_count = await sandbox.probe(count_pages, path)
+    if page_count is None:
+        raise HTTPException(status_code=422, detail="File is not a readable PDF.")
+    if page_count > MAX_PDF_PAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"PDF has {page_count} pages; the limit is {MAX_PDF_PAGES}.",
+        )
+    return page_count
+
+
+@asynccontextmanager
+async def spool_upload(file, keep: bool = False, check_pages: bool = True):
+    """
+    Copy an UploadFile to a temp file in chunks, enforcing the byte and page caps.
+    Yields a SpooledUpload; the temp file is removed when the block exits,
+    unless keep is set (then the caller owns it once the block exits cleanly).
+    Without check_pages the page count is left to the parse job, which
+    enforces the same cap when it opens the document.
+    """
+    # Starlette already knows the size for most uploads; reject those without copying
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+
+    fd, path = tempfile.mkstemp(prefix="flagtech-", suffix=".pdf", dir=UPLOAD_DIR)
+    try:
+        size = 0
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as out:
+            await file.seek(0)
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size = _check_chunk(size, chunk)
+                digest.update(chunk)
+                out.write(chunk)
+
+        if check_pages:
+            page_count = await _check_pages(path, size)
+        else:
+            _check_empty(size)
+            page_count = None
+        yield SpooledUpload(path=path, size=size, page_count=page_count, sha256=digest.hexdigest())
+    except BaseException:
+        keep = False
+        raise
+    finally:
+        if not keep:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+# ---------------------------------------------------------
+# BATCH UPLOADS (several PDFs and/or ZIPs of PDFs)
+# ---------------------------------------------------------
+
+@dataclass
+class BatchEntry:
+    """One document in a batch: spooled, or rejected with the reason."""
+    filename: str
+    upload: Optional[SpooledUpload] = None
+    error: Optional[str] = None
+
+
+def _is_zip(file) -> bool:
+    return (file.filename or "").lower().endswith(".zip") or file.content_type in ZIP_CONTENT_TYPES
+
+
+def _spool_zip_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> SpooledUpload:
+    """
+    Copy one archive member to a temp file under the same byte caps as a
+    direct upload. The page cap is left to the parse job.
+    """
+    # Declared sizes can lie, so _check_chunk still counts the real bytes
+    if info.file_size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+
+    fd, path = tempfile.mkstemp(prefix="flagtech-", suffix=".pdf", dir=UPLOAD_DIR)
+    try:
+        size = 0
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as out, zf.open(info) as src:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size = _check_chunk(size, chunk)
+                digest.update(chunk)
+                out.write(chunk)
+        _check_empty(size)
+        return SpooledUpload(path=path, size=size, page_count=None, sha256=digest.hexdigest())
+    except BaseException:
+        os.unlink(path)
+        raise
+
+
+def _batch_too_large() -> HTTPException:
+    limit_mb = MAX_BATCH_BYTES / (1024 * 1024)
+    return HTTPException(status_code=413, detail=f"Batch is larger than the {limit_mb:.0f} MB limit once unpacked.")
+
+
+def _too_many_files() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Batch has more than {MAX_BATCH_FILES} documents.")
+
+
+def _unpack_zip(zip_path: str, zip_name: str, max_files: int, max_bytes: int) -> List[BatchEntry]:
+    """
+    Spool every PDF in an archive. Bad members become error entries. The
+    member count and declared sizes are checked against what is left of the
+    batch caps before anything is extracted, and the real sizes as members
+    are extracted, so an archive can never fill the disk.
+    """
+    try:
+        zf = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        return [BatchEntry(filename=zip_name, error="File is not a readable ZIP archive.")]
+
+    entries = []
+    try:
+        with zf:
+            members = [info for info in zf.infolist() if not info.is_dir() and info.filename.lower().endswith(".pdf")]
+            if len(members) > max_files:
+                raise _too_many_files()
+            declared = 0
+            for info in members:
+                declared += info.file_size
+                if declared > max_bytes:
+                    raise _batch_too_large()
+
+            spooled = 0
+            for info in members:
+                name = f"{zip_name}/{info.filename}"
+                try:
+                    upload = _spool_zip_member(zf, info)
+                except HTTPException as e:
+                    entries.append(BatchEntry(filename=name, error=e.detail))
+                    continue
+                except Exception as e:
+                    entries.append(BatchEntry(filename=name, error=f"Could not extract: {e}"))
+                    continue
+                entries.append(BatchEntry(filename=name, upload=upload))
+                # Declared sizes can lie; stop once the real bytes are over
+                spooled += upload.size
+                if spooled > max_bytes:
+                    raise _batch_too_large()
+    except BaseException:
+        for entry in entries:
+            if entry.upload is not None:
+                _discard(entry.upload.path)
+        raise
+    return entries
+
+
+async def _spool_zip(file, max_files: int, max_bytes: int) -> List[BatchEntry]:
+    """Stream a ZIP upload to disk, then unpack its PDFs in a thread (see _unpack_zip)."""
+    fd, path = tempfile.mkstemp(prefix="flagtech-", suffix=".zip", dir=UPLOAD_DIR)
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as out:
+            await file.seek(0)
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_ZIP_BYTES:
+                    limit_mb = MAX_ZIP_BYTES / (1024 * 1024)
+                    return [BatchEntry(filename=file.filename or "", error=f"ZIP is larger than the {limit_mb:.0f} MB limit.")]
+                out.write(chunk)
+        return await asyncio.to_thread(_unpack_zip, path, file.filename or "upload.zip", max_files, max_bytes)
+    finally:
+        os.unlink(path)
+
+
+def _discard(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+@asynccontextmanager
+async def spool_batch(files):
+    """
+    Spool a batch of UploadFiles; ZIPs are expanded to their PDF members.
+    Yields a list of BatchEntry (rejected files carry an error instead of an
+    upload). Every temp file is removed when the block exits. Page counts
+    are not checked here, so results can start streaming right away; each
+    document's parse job enforces the page cap when it opens it.
+    """
+    async with AsyncExitStack() as stack:
+        entries: List[BatchEntry] = []
+        spooled = 0
+        for file in files:
+            if _is_zip(file):
+                members = await _spool_zip(file, MAX_BATCH_FILES - len(entries), MAX_BATCH_BYTES - spooled)
+                for entry in members:
+                    if entry.upload is not None:
+                        stack.callback(_discard, entry.upload.path)
+                        spooled += entry.upload.size
+                entries.extend(members)
+            else:
+                try:
+                    upload = await stack.enter_async_context(spool_upload(file, check_pages=False))
+                    entries.append(BatchEntry(filename=file.filename or "", upload=upload))
+                    spooled += upload.size
+                except HTTPException as e:
+                    entries.append(BatchEntry(filename=file.filename or "", error=e.detail))
+
+            if len(entries) > MAX_BATCH_FILES:
+                raise _too_many_files()
+            if spooled > MAX_BATCH_BYTES:
+                raise _batch_too_large()
+        yield entries
@@ -0,0 +1,70 @@
+"""Columnar word storage for the grid pipeline.
+
+One array per attribute instead of one dict per word, so the grid stages
+filter and compare whole pages with NumPy masks instead of dict lookups.
+"""
+
+import sys
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, List
+
+import numpy as np
+
+_COORDS = itemgetter("x0", "y0", "x1", "y1")
+_TEXT = itemgetter("text")
+
+
+@dataclass
+class WordStore:
+    """
+    All words of a document, in page order and extraction order within a page.
+    Coordinates are float32 (MuPDF reports single precision, so this is
+    lossless); midpoints stay float64 because a half-sum of two float32 values
+    needs one more bit and the grid's row/column thresholds compare against them.
+    """
+    x0: np.ndarray
+    y0: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    xmid: np.ndarray
+    ymid: np.ndarray
+    page: np.ndarray   # int16, 1-based like the grid's page numbers
+    text: np.ndarray   # object array of interned strings
+    page_starts: np.ndarray  # word offset of each page, plus the total at the end
+
+    @classmethod
+    def from_pages(cls, pages: List[Dict]) -> "WordStore":
+        """Build a store from extractor pages ({"words": [{"x0", "y0", "x1", "y1", "text"}, ...]})."""
+        counts = [len(page.get("words", [])) for page in pages]
+        words = [w for page in pages for w in page.get("words", [])]
+
+        coords = np.array(list(map(_COORDS, words)), dtype=np.float64).reshape(-1, 4)
+        text = np.empty(len(words), dtype=object)
+        text[:] = list(map(sys.intern, map(_TEXT, words)))
+
+        return cls(
+            x0=coords[:, 0].astype(np.float32),
+            y0=coords[:, 1].astype(np.float32),
+            x1=coords[:, 2].astype(np.float32),
+            y1=coords[:, 3].astype(np.float32),
+            # Same arithmetic as the dict pipeline used, so thresholds land identically
+            xmid=(coords[:, 0] + coords[:, 2]) / 2.0,
+            ymid=(coords[:, 1] + coords[:, 3]) / 2.0,
+            page=np.repeat(np.arange(1, len(pages) + 1, dtype=np.int16), counts),
+            text=text,
+            page_starts=np.concatenate(([0], np.cumsum(counts, dtype=np.int64))),
+        )
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_starts) - 1
+
+    def page_indices(self, pi: int, mask: np.ndarray) -> np.ndarray:
+        """Indices of page pi's words (1-based) that are set in mask, in extraction order."""
+        lo, hi = self.page_starts[pi - 1], self.page_starts[pi]
+        return lo + np.flatnonzero(mask[lo:hi])
+
@@ -27,10 +27,13 @@ def clean_float(value: str) -> float | None:
     except ValueError:
         return None
 
+# CCC operation codes, in their canonical (upper-case) spelling
+OPERATION_CODES = ("REPL", "R&I", "RPR", "REFN", "BLND", "O/H", "SUBLET", "ALGN", "<>")
+
 def normalize_operation(op: str) -> str | None:
     """Standardize operation codes like 'Repl', 'R&I', 'O/H'."""
     op = op.strip().upper()
-    if op in ["REPL", "R&I", "O/H", "<>"]:
+    if op in OPERATION_CODES:
         return op
     return None
 
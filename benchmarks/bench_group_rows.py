@@ -0,0 +1,98 @@
+"""
+Benchmark grid_processor.group_rows against the original quadratic version
+and check that both produce the same rows.
+
+    python -m benchmarks.bench_group_rows [estimate.pdf ...]
+
+Without arguments it runs on synthetic pages (estimate-like rows with
+jittered baselines). With PDFs it groups the words of every page.
+"""
+import random
+import sys
+import time
+
+from app.services.grid_processor import group_rows
+
+
+def group_rows_quadratic(words, y_thresh=8.0):
+    """The original implementation: try every row, re-average on each insert."""
+    rows = []
+    for w in sorted(words, key=lambda x: (x["y0"] + x["y1"]) / 2):
+        ymid = (w["y0"] + w["y1"]) / 2
+        placed = False
+        for r in rows:
+            if abs(r["ymid"] - ymid) <= y_thresh:
+                r["words"].append(w)
+                r["ymid"] = sum(((ww["y0"] + ww["y1"]) / 2 for ww in r["words"])) / len(r["words"])
+                placed = True
+                break
+        if not placed:
+            rows.append({"ymid": ymid, "words": [w]})
+    return rows
+
+
+def synthetic_page(seed, rows=55, words_per_row=12, jitter=2.5):
+    rng = random.Random(seed)
+    words = []
+    for r in range(rows):
+        base = 40 + r * rng.uniform(9.0, 16.0)
+        for c in range(words_per_row):
+            y0 = base + rng.uniform(-jitter, jitter)
+            words.append({"x0": 30.0 + 45 * c, "y0": y0, "x1": 60.0 + 45 * c, "y1": y0 + 8.0, "text": f"w{r}.{c}"})
+    rng.shuffle(words)
+    return words
+
+
+def pdf_pages(paths):
+    from app.services.extractor import extract_words_from_pdf
+
+    pages = []
+    for path in paths:
+        pages.extend(page["words"] for page in extract_words_from_pdf(path))
+    return pages
+
+
+def same_rows(a, b):
+    return len(a) == len(b) and all(
+        ra["ymid"] == rb["ymid"] and [id(w) for w in ra["words"]] == [id(w) for w in rb["words"]]
+        for ra, rb in zip(a, b)
+    )
+
+
+def timed(fn, pages, y_thresh, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for words in pages:
+            fn(words, y_thresh=y_thresh)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    if len(sys.argv) > 1:
+        pages = pdf_pages(sys.argv[1:])
+        label = f"{len(sys.argv) - 1} PDF(s)"
+    else:
+        pages = [synthetic_page(seed) for seed in range(30)]
+        label = "30 synthetic pages"
+
+    n_words = sum(len(words) for words in pages)
+    print(f"{label}: {len(pages)} pages, {n_words} words")
+
+    for y_thresh in (6.0, 8.0):
+        for words in pages:
+            if not same_rows(group_rows(words, y_thresh), group_rows_quadratic(words, y_thresh)):
+                print(f"MISMATCH at y_thresh={y_thresh}")
+                sys.exit(1)
+
+        old = timed(group_rows_quadratic, pages, y_thresh, repeat=3)
+        new = timed(group_rows, pages, y_thresh, repeat=3)
+        print(
+            f"y_thresh={y_thresh}: quadratic {old * 1000:.1f} ms, sweep {new * 1000:.1f} ms "
+            f"({old / new:.1f}x), rows identical"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# The parse caches read their directory at import; keep test runs out of the real one
+os.environ.setdefault("FLAGTECH_CACHE_DIR", tempfile.mkdtemp(prefix="flagtech-test-cache-"))
@@ -0,0 +1,41 @@
+"""The anchor-first pass must find the rows full-page detection finds."""
+
+import fitz
+
+from app.services.document import ParsedDocument
+from app.services.extractor import extract_words_from_pdf, locate_line_item_region
+from app.services.grid_processor import RowIndex, detect_anchors_and_vehicle_info
+from app.services.word_store import WordStore
+
+
+def make_wrapped_header(path):
+    """An RO line whose words sit on wandering baselines, next to loose header fields."""
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((40, 60), "RO Number: 12345", fontsize=8)
+    for x, dy, text in ((415.5, 9.1, "Ins"), (457.3, -0.7, "Date"), (404.9, -4.0, "Ins")):
+        page.insert_text((x, 100 + dy), text, fontsize=8)
+    x = 40
+    for dy, text in ((0.0, "Wrap"), (4.9, "RO"), (1.4, "S01")):
+        page.insert_text((x, 100 + dy), text, fontsize=8)
+        x += 8 * len(text)
+    y = 140
+    for text in ("2019 HONDA CIVIC LX", "Line Oper Description Qty Extended Labor Paint", "1 Repl Hood 1 100.00 2.0"):
+        page.insert_text((40, y), text, fontsize=8)
+        y += 14
+    page.insert_text((40, y + 16), "ESTIMATE TOTALS", fontsize=8)
+    doc.save(str(path))
+    doc.close()
+
+
+def test_region_matches_full_page_rows(tmp_path):
+    path = tmp_path / "wrapped.pdf"
+    make_wrapped_header(path)
+
+    with ParsedDocument(str(path)) as doc:
+        region = locate_line_item_region(doc, {})
+    pages = extract_words_from_pdf(str(path))
+    expected = detect_anchors_and_vehicle_info(RowIndex(pages, WordStore.from_pages(pages)))[:4]
+
+    assert expected[0] == 1
+    assert (region["anchor_page"], region["anchor_ymid"], region["subtotals_page"], region["subtotals_ymid"]) == expected
@@ -0,0 +1,108 @@
+"""/api/parse-batch: ZIP caps and one line per document, bad members included."""
+
+import io
+import json
+import zipfile
+
+import fitz
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import uploads
+
+
+def estimate_pdf() -> bytes:
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    y = 60
+    for text in (
+        "RO Number: 12345",
+        "RO 12345",
+        "2019 HONDA CIVIC LX",
+        "Line Oper Description Qty Extended Labor Paint",
+        "1 Repl Hood 1 100.00 2.0",
+        "ESTIMATE TOTALS",
+    ):
+        page.insert_text((40, y), text, fontsize=8)
+        y += 14
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def blank_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def zip_of(members) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def post_batch(client, files):
+    return client.post("/api/parse-batch", files=[("files", f) for f in files])
+
+
+def test_bad_members_get_their_own_error_lines(client):
+    archive = zip_of([
+        ("good.pdf", estimate_pdf()),
+        ("notes.pdf", b"just text"),
+        ("truncated.pdf", b"%PDF-1.4 garbage"),
+        ("long.pdf", blank_pdf(uploads.MAX_PDF_PAGES + 1)),
+        ("readme.txt", b"skipped: not a PDF name"),
+    ])
+    r = post_batch(client, [("b.zip", archive, "application/zip")])
+    assert r.status_code == 200
+    lines = {line["filename"]: line for line in map(json.loads, r.text.splitlines())}
+
+    assert set(lines) == {"b.zip/good.pdf", "b.zip/notes.pdf", "b.zip/truncated.pdf", "b.zip/long.pdf"}
+    assert "error" not in lines["b.zip/good.pdf"]
+    assert lines["b.zip/notes.pdf"]["error"] == "Upload is not a PDF."
+    assert lines["b.zip/truncated.pdf"]["error"] == "File is not a readable PDF."
+    assert "parse budget" in lines["b.zip/long.pdf"]["error"]
+
+
+def test_member_count_cap(client, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_BATCH_FILES", 2)
+    archive = zip_of([(f"e{i}.pdf", estimate_pdf()) for i in range(3)])
+    r = post_batch(client, [("b.zip", archive, "application/zip")])
+    assert r.status_code == 413
+    assert "more than 2 documents" in r.json()["detail"]
+
+
+def test_declared_size_cap(client, monkeypatch):
+    member = estimate_pdf()
+    monkeypatch.setattr(uploads, "MAX_BATCH_BYTES", len(member) + 10)
+    archive = zip_of([("e0.pdf", member), ("e1.pdf", member)])
+    r = post_batch(client, [("b.zip", archive, "application/zip")])
+    assert r.status_code == 413
+    assert "once unpacked" in r.json()["detail"]
+
+
+def test_real_size_cap_across_files(client, monkeypatch):
+    # A ZIP can't unpack past its declared sizes, so the running total is what
+    # stops a batch whose files are each fine but too much together
+    member = estimate_pdf()
+    monkeypatch.setattr(uploads, "MAX_BATCH_BYTES", 2 * len(member) + 10)
+    r = post_batch(client, [
+        ("b.zip", zip_of([("e0.pdf", member)]), "application/zip"),
+        ("e1.pdf", member, "application/pdf"),
+        ("e2.pdf", member, "application/pdf"),
+    ])
+    assert r.status_code == 413
+    assert "once unpacked" in r.json()["detail"]
@@ -0,0 +1,37 @@
+"""Binary-search column lookups match the per-column scans they replaced."""
+
+import random
+
+import numpy as np
+
+from app.services.columns import ColumnBands, NearestColumns
+
+
+def test_column_bands_match_interval_tests():
+    rng = random.Random(17)
+    for _ in range(200):
+        bands = {}
+        for name in "abcdef":
+            if rng.random() < 0.15:
+                bands[name] = None
+                continue
+            lo = round(rng.uniform(0, 600))
+            bands[name] = (lo, lo + round(rng.uniform(-10, 80)))
+        edges = [x for span in bands.values() if span for x in span]
+        # Include points exactly on band edges
+        xs = np.array([rng.choice(edges) if edges and rng.random() < 0.3 else rng.uniform(-20, 700) for _ in range(50)])
+
+        members = ColumnBands(bands).members(xs)
+        for name, span in bands.items():
+            expected = [span is not None and span[0] < x < span[1] for x in xs.tolist()]
+            assert members[name].tolist() == expected
+
+
+def test_nearest_columns_match_min():
+    rng = random.Random(18)
+    for _ in range(200):
+        centers = sorted(round(rng.uniform(0, 600)) for _ in range(rng.randint(1, 8)))
+        # Midpoints between centers are ties; min() gives them to the left one
+        xs = [rng.uniform(-20, 620) for _ in range(40)] + [(a + b) / 2 for a, b in zip(centers, centers[1:])]
+        expected = [min(range(len(centers)), key=lambda i: abs(x - centers[i])) for x in xs]
+        assert NearestColumns(centers).assign(xs) == expected
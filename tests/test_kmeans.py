@@ -0,0 +1,136 @@
+"""k-means against naive references, and header-less pages read like headed ones."""
+
+import itertools
+import random
+
+import fitz
+
+from app.services.extractor import extract_line_item_pages
+from app.services.grid_processor import process_pdf_grid
+from app.services.kmeans import kmeans_1d, kmeans_1d_exact
+
+
+# ---------------------------------------------------------
+# NAIVE REFERENCES
+# ---------------------------------------------------------
+
+def kmeans_1d_loop(values, k, iters=40):
+    """The original pure-Python Lloyd's loop kmeans_1d replaced."""
+    if not values or k <= 0:
+        return []
+    if len(values) < k:
+        return sorted(set(values))
+
+    sorted_vals = sorted(values)
+    step = len(sorted_vals) / k
+    centers = [sorted_vals[min(int(i * step), len(sorted_vals) - 1)] for i in range(k)]
+    for _ in range(iters):
+        clusters = [[] for _ in range(k)]
+        for val in values:
+            clusters[min(range(k), key=lambda i: abs(val - centers[i]))].append(val)
+        centers = [sum(c) / len(c) if c else centers[i] for i, c in enumerate(clusters)]
+    return sorted(centers)
+
+
+def best_partition_sse(values, k):
+    """Minimum within-cluster sum of squares over every split of the sorted values into k runs."""
+    xs = sorted(values)
+    best = float("inf")
+    for cuts in itertools.combinations(range(1, len(xs)), k - 1):
+        bounds = (0,) + cuts + (len(xs),)
+        total = 0.0
+        for lo, hi in zip(bounds, bounds[1:]):
+            run = xs[lo:hi]
+            mean = sum(run) / len(run)
+            total += sum((x - mean) ** 2 for x in run)
+        best = min(best, total)
+    return best
+
+
+def sse(values, centers):
+    return sum(min((x - c) ** 2 for c in centers) for x in values)
+
+
+def x_values(rng, n):
+    # Column-like clumps with exact repeats, as word x-midpoints are
+    anchors = [rng.uniform(30, 580) for _ in range(rng.randint(2, 7))]
+    return [round(rng.choice(anchors) + rng.gauss(0, 6), rng.choice((0, 1, 2))) for _ in range(n)]
+
+
+# ---------------------------------------------------------
+# K-MEANS
+# ---------------------------------------------------------
+
+def test_kmeans_1d_matches_the_loop():
+    rng = random.Random(15)
+    for _ in range(300):
+        values = x_values(rng, rng.randint(0, 60))
+        k = rng.randint(1, 8)
+        assert kmeans_1d(values, k) == kmeans_1d_loop(values, k)
+
+
+def test_kmeans_1d_exact_is_optimal():
+    rng = random.Random(16)
+    for _ in range(200):
+        values = x_values(rng, rng.randint(1, 11))
+        k = rng.randint(1, 5)
+        centers = kmeans_1d_exact(values, k)
+        if len(set(values)) <= k:
+            assert centers == sorted(set(values))
+            continue
+        assert len(centers) == k
+        assert abs(sse(values, centers) - best_partition_sse(values, k)) <= 1e-6 * (1 + best_partition_sse(values, k))
+
+
+# ---------------------------------------------------------
+# HEADER-LESS COLUMN INFERENCE
+# ---------------------------------------------------------
+
+COLUMN_X = {"line": 40, "oper": 62, "description": 100, "qty": 380, "ext_price": 420, "labor": 480, "paint": 530}
+
+ITEMS = [
+    ("1", "Repl", "Front bumper cover", "1", "420.00", "2.5", "3.0"),
+    ("2", "R&I", "Grille", "1", "0.00", "0.6", ""),
+    ("3", "Rpr", "Hood", "0", "0.00", "1.8", "2.4"),
+    ("4", "Repl", "RT Headlamp assy", "1", "310.00", "0.4", ""),
+    ("5", "Refn", "Clear coat", "0", "0.00", "", "1.1"),
+    ("6", "Repl", "RT Fender", "1", "198.50", "1.9", "2.2"),
+]
+
+
+def estimate_pdf(path, with_header):
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((40, 40), "RO Number: 4711", fontsize=8)
+    page.insert_text((40, 80), "RO 4711", fontsize=8)
+    page.insert_text((40, 94), "2020 TOYOTA CAMRY SE", fontsize=8)
+    y = 120
+    if with_header:
+        for key, text in (("line", "Line"), ("oper", "Oper"), ("description", "Description"),
+                          ("qty", "Qty"), ("ext_price", "Extended"), ("labor", "Labor"), ("paint", "Paint")):
+            page.insert_text((COLUMN_X[key], y), text, fontsize=8)
+    for row in ITEMS:
+        y += 16
+        for key, text in zip(("line", "oper", "description", "qty", "ext_price", "labor", "paint"), row):
+            if text:
+                page.insert_text((COLUMN_X[key], y), text, fontsize=8)
+    page.insert_text((40, y + 30), "ESTIMATE TOTALS", fontsize=8)
+    doc.save(str(path))
+    doc.close()
+
+
+def items(path):
+    pages, region = extract_line_item_pages(str(path))
+    result = process_pdf_grid(pages, region)
+    return [
+        [(item["line"], item["value"]) for item in result[kind]]
+        for kind in ("labor_items", "paint_items")
+    ]
+
+
+def test_header_less_page_gives_the_same_items(tmp_path):
+    estimate_pdf(tmp_path / "header.pdf", with_header=True)
+    estimate_pdf(tmp_path / "no-header.pdf", with_header=False)
+    headed = items(tmp_path / "header.pdf")
+    assert headed[0] and headed[1]
+    assert items(tmp_path / "no-header.pdf") == headed
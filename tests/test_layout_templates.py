@@ -0,0 +1,80 @@
+"""Layout templates must never override the header row printed on the page."""
+
+import fitz
+
+from app.services.extractor import extract_line_item_pages, iter_line_item_pages
+from app.services.grid_processor import iter_line_items, layout_fingerprint, process_pdf_grid
+
+# Same fonts and page size, different value columns
+LAYOUT_C = {"qty": 380, "ext_price": 430, "labor": 490, "paint": 540}
+LAYOUT_D = {"qty": 400, "ext_price": 470, "labor": 520, "paint": 565}
+
+LINES = [
+    # line, description, price, labor, paint
+    ("1", "Front bumper cover", "187.27", "4.8", "1.2"),
+    ("2", "Hood panel", "710.64", "3.7", ""),
+    ("3", "Fender LT", "498.21", "3.2", "1.6"),
+    ("4", "Headlamp assy", "538.41", "1.7", ""),
+    ("5", "Door shell RT", "450.61", "2.8", "0.9"),
+]
+
+
+def make_estimate(path, columns):
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    y = 40
+
+    def put(x, text):
+        page.insert_text((x, y), text, fontsize=8)
+
+    for text in ("RO Number: 12345", "Customer: John Smith", "RO 12345", "2019 HONDA CIVIC LX 4D SED"):
+        put(40, text)
+        y += 14
+    for x, text in ((40, "Line"), (70, "Oper"), (110, "Description"), (columns["qty"], "Qty"),
+                    (columns["ext_price"], "Extended"), (columns["labor"], "Labor"), (columns["paint"], "Paint")):
+        put(x, text)
+    y += 14
+    for line, description, price, labor, paint in LINES:
+        put(42, line)
+        put(70, "Repl")
+        put(110, description)
+        put(columns["qty"], "1")
+        put(columns["ext_price"], price)
+        put(columns["labor"], labor)
+        if paint:
+            put(columns["paint"], paint)
+        y += 14
+    y += 10
+    put(40, "ESTIMATE TOTALS")
+    doc.save(str(path))
+    doc.close()
+
+
+def parse(path):
+    pages, region = extract_line_item_pages(str(path))
+    return pages, region, process_pdf_grid(pages, region)
+
+
+def test_same_fonts_different_columns(tmp_path):
+    c_path = tmp_path / "c.pdf"
+    d_path = tmp_path / "d.pdf"
+    make_estimate(c_path, LAYOUT_C)
+    make_estimate(d_path, LAYOUT_D)
+
+    expected_labor = round(sum(float(labor) for _, _, _, labor, _ in LINES), 2)
+    expected_paint = round(sum(float(paint) for *_, paint in LINES if paint), 2)
+
+    c_pages, c_region, c_result = parse(c_path)
+    # d is parsed after c's layout was learned, sharing its cache
+    d_pages, d_region, d_result = parse(d_path)
+
+    assert c_pages[0]["fonts"] == d_pages[0]["fonts"]
+    assert layout_fingerprint(c_pages[0]) != layout_fingerprint(d_pages[0])
+    for result in (c_result, d_result):
+        assert round(result["total_labor"], 2) == expected_labor
+        assert round(result["total_paint"], 2) == expected_paint
+
+    region = {}
+    streamed = list(iter_line_items(iter_line_item_pages(str(d_path), region), region))
+    assert [item["value"] for item in streamed if item["kind"] == "labor"] == \
+        [item["value"] for item in d_result["labor_items"]]
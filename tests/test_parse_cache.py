@@ -0,0 +1,27 @@
+"""The cache directory holds pickles, so it must be private to the server's user."""
+
+import os
+import stat
+
+import pytest
+
+from app.services import parse_cache
+
+
+def test_cache_dir_is_made_private(tmp_path):
+    shared = tmp_path / "cache"
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+    parse_cache._private_dir(str(shared))
+    assert stat.S_IMODE(os.stat(shared).st_mode) == 0o700
+
+
+def test_cache_dir_of_another_user_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(tmp_path).st_uid + 1)
+    with pytest.raises(RuntimeError, match="owned by another user"):
+        parse_cache._private_dir(str(tmp_path / "cache"))
+
+
+def test_new_cache_dir_is_private(tmp_path):
+    parse_cache._private_dir(str(tmp_path / "new"))
+    assert stat.S_IMODE(os.stat(tmp_path / "new").st_mode) == 0o700
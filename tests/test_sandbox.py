@@ -0,0 +1,135 @@
+"""Sandbox budgets: each failure gives a clean HTTP error, and broken workers are replaced."""
+
+import asyncio
+import os
+import tempfile
+import time
+
+import fitz
+from fastapi import HTTPException
+
+from app.services import sandbox
+
+
+# Jobs run in spawned workers, so they must be importable top-level functions
+
+def sleep_job(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def many_pages_job():
+    sandbox.check_page_budget(sandbox.PARSE_PAGE_BUDGET + 1)
+
+
+def render_job(dpi):
+    doc = fitz.open()
+    doc.new_page(width=612, height=792)
+    return len(doc[0].get_pixmap(dpi=dpi).samples)
+
+
+def extended_job(seconds):
+    sandbox.extend_budget(seconds * 4)
+    return sleep_job(seconds)
+
+
+def child_job(pid_file):
+    """Start a long-running child (as pytesseract starts Tesseract), then hang."""
+    import subprocess
+
+    child = subprocess.Popen(["sleep", "30"])
+    with open(pid_file, "w") as f:
+        f.write(str(child.pid))
+    time.sleep(30)
+
+
+def crash_job():
+    os._exit(1)
+
+
+def unexpected_job():
+    raise KeyError("boom")
+
+
+def run_on_fresh_pool(fn, *args, timeout=None):
+    """Run one job on a new single-worker pool; returns (result or HTTPException, pool stats)."""
+    async def main():
+        pool = sandbox.SandboxPool(1)
+        try:
+            # Start-up time must not count against the tiny budgets
+            await pool.run(sleep_job, 0)
+            try:
+                outcome = await pool.run(fn, *args, timeout=timeout)
+            except HTTPException as e:
+                outcome = e
+            # The pool must still work after the failure
+            assert await pool.run(sleep_job, 0) == 0
+            return outcome, pool.stats()
+        finally:
+            pool.shutdown()
+
+    return asyncio.run(main())
+
+
+def test_timeout_replaces_the_worker():
+    outcome, stats = run_on_fresh_pool(sleep_job, 30, timeout=0.5)
+    assert isinstance(outcome, HTTPException) and outcome.status_code == 422
+    assert stats["killed_timeout"] == 1
+
+
+def test_page_budget_is_rejected():
+    outcome, stats = run_on_fresh_pool(many_pages_job)
+    assert isinstance(outcome, HTTPException) and outcome.status_code == 422
+    assert "parse budget" in outcome.detail
+    assert stats["over_page_budget"] == 1
+
+
+def test_memory_budget_replaces_the_worker(monkeypatch):
+    # Workers read the cap when they start; a letter-size page at 1500 dpi needs about 630 MB
+    monkeypatch.setenv("FLAGTECH_PARSE_MEMORY_MB", "500")
+    outcome, stats = run_on_fresh_pool(render_job, 1500)
+    assert isinstance(outcome, HTTPException) and outcome.status_code == 422
+    assert "memory" in outcome.detail
+    assert stats["killed_memory"] == 1
+
+
+def test_crash_is_503():
+    outcome, stats = run_on_fresh_pool(crash_job)
+    assert isinstance(outcome, HTTPException) and outcome.status_code == 503
+    assert stats["killed_crashed"] == 1
+
+
+def test_unexpected_error_is_503():
+    outcome, stats = run_on_fresh_pool(unexpected_job)
+    assert isinstance(outcome, HTTPException) and outcome.status_code == 503
+    assert stats["failed"] == 1
+
+
+def test_result_comes_back():
+    outcome, stats = run_on_fresh_pool(render_job, 72)
+    assert outcome == 612 * 792 * 3
+    assert stats["jobs"] == 3
+
+
+def test_extended_budget_lets_the_job_finish():
+    outcome, stats = run_on_fresh_pool(extended_job, 1.0, timeout=0.5)
+    assert outcome == 1.0
+    assert stats["killed_timeout"] == 0
+
+
+def test_replacing_a_worker_kills_its_children():
+    fd, pid_file = tempfile.mkstemp()
+    os.close(fd)
+    outcome, stats = run_on_fresh_pool(child_job, pid_file, timeout=2)
+    assert isinstance(outcome, HTTPException) and stats["killed_timeout"] == 1
+    with open(pid_file) as f:
+        pid = int(f.read())
+    os.unlink(pid_file)
+    # Killed along with the worker (reaped by init, or a zombie at worst)
+    time.sleep(0.2)
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            state = f.read().split()[2]
+    except FileNotFoundError:
+        state = None
+    assert state in (None, "Z")
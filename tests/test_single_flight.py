@@ -0,0 +1,86 @@
+"""Shared parses own their input and stop when nobody is waiting for them."""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from app.services import parse_pool, single_flight
+from app.services.uploads import BatchEntry, SpooledUpload
+
+
+def spooled(content: bytes) -> SpooledUpload:
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return SpooledUpload(path=path, size=len(content), page_count=1, sha256=hashlib.sha256(content).hexdigest())
+
+
+class SlowParse:
+    """Stands in for the sandbox: takes a while, then checks the file it was given is still there."""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self, fn, path, key, job_id=None):
+        self.started += 1
+        try:
+            await asyncio.sleep(0.3)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        with open(path, "rb"):
+            pass
+        return {"result": None, "pages": []}
+
+
+def test_closed_batch_leaves_the_joined_parse_running(monkeypatch):
+    parse = SlowParse()
+    monkeypatch.setattr(parse_pool, "run_in_pool", parse)
+
+    async def main():
+        first = spooled(b"%PDF-1.4 closed batch")
+        second = spooled(b"%PDF-1.4 closed batch")
+        lines = parse_pool.parse_batch([BatchEntry(filename="a.pdf", upload=first)])
+        reading = asyncio.ensure_future(lines.__anext__())
+        await asyncio.sleep(0.05)
+        # The same document again, e.g. a re-upload to /ui/grid
+        joiner = asyncio.ensure_future(parse_pool.grid_for_upload(second))
+        await asyncio.sleep(0.05)
+
+        # The batch client goes away; spool_batch then removes its files
+        reading.cancel()
+        try:
+            await reading
+        except asyncio.CancelledError:
+            pass
+        await lines.aclose()
+        os.unlink(first.path)
+
+        parsed = await joiner
+        os.unlink(second.path)
+        return parsed
+
+    parsed = asyncio.run(main())
+    assert parsed["result"] is None
+    assert (parse.started, parse.cancelled) == (1, 0)
+
+
+def test_parse_nobody_waits_for_is_cancelled(monkeypatch):
+    parse = SlowParse()
+    monkeypatch.setattr(parse_pool, "run_in_pool", parse)
+
+    async def main():
+        upload = spooled(b"%PDF-1.4 abandoned")
+        waiting = asyncio.ensure_future(parse_pool.grid_for_upload(upload))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        await asyncio.sleep(0.05)
+        os.unlink(upload.path)
+        return single_flight.stats()
+
+    stats = asyncio.run(main())
+    assert (parse.started, parse.cancelled) == (1, 1)
+    assert stats["in_flight"] == 0
+    assert not os.listdir(single_flight.INPUT_DIR)
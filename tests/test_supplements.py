@@ -0,0 +1,44 @@
+"""A supplement is diffed once per RO and its added lines land once."""
+
+import json
+
+from app.routes.estimate import _update_assignments
+
+
+def item(line, description, value):
+    return {"line": line, "description": description, "value": value}
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.updates = {}
+
+    def execute(self, query, params):
+        if query.lstrip().startswith("UPDATE"):
+            self.updates[params[-1]] = params
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_added_lines_go_once_to_the_unassigned_pool():
+    bumper, fender, door = item(1, "Bumper", 2.0), item(2, "Fender", 3.0), item(3, "Door", 1.5)
+    # One save per tech, each with the whole estimate; the latest is the RO's last parse
+    rows = [
+        {"id": 1, "ro": "RO 123", "tech": "A", "assigned": json.dumps([bumper]), "unassigned": json.dumps([fender, door]), "total": 2.0},
+        {"id": 2, "ro": "RO 123", "tech": "B", "assigned": json.dumps([fender]), "unassigned": json.dumps([bumper, door]), "total": 3.0},
+    ]
+    cur = FakeCursor(rows)
+    new = [bumper, item(2, "Fender", 4.0), item(4, "Hood", 1.0)]
+    result = {"second_ro_line": "RO 123 Supplement S01", "vehicle_info_line": ""}
+
+    diff = _update_assignments(cur, "labor_assignments", "total_labor", "123", result, new)
+
+    assert (diff["added"], diff["removed"], diff["changed"]) == (1, 1, 1)
+    first, latest = cur.updates[1], cur.updates[2]
+    assert json.loads(first[2]) == [bumper]
+    assert json.loads(first[3]) == [item(2, "Fender", 4.0)]
+    assert json.loads(latest[2]) == [item(2, "Fender", 4.0)]
+    assert json.loads(latest[3]) == [bumper, item(4, "Hood", 1.0)]
+    assert latest[4] == 4.0